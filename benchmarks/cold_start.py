@@ -0,0 +1,116 @@
+"""
+Cold-start benchmark for the login page.
+
+    python -m benchmarks.cold_start --runs 5
+    python -m benchmarks.cold_start --max-first-run-ms 800 --max-rerun-ms 50
+
+Each run starts a fresh interpreter that renders editor_app.py with
+Streamlit's AppTest (no server, no browser), timing the first script run
+and the following reruns of the login page, and listing which heavy backend
+modules that pulled in. The report shows medians over the runs; with budgets
+set, the exit status is 1 when a median is over budget or a heavy module was
+imported by the login page at all.
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+# Backends the login page must not import before they are used.
+HEAVY_MODULES = ("gspread", "oauth2client", "googleapiclient", "smtplib")
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def child(reruns):
+    """Measure one cold start in this (fresh) process and print it as JSON."""
+    start = time.perf_counter()
+    from streamlit.testing.v1 import AppTest
+    streamlit_ms = (time.perf_counter() - start) * 1000
+
+    before = set(sys.modules)
+    app = AppTest.from_file(os.path.join(ROOT, "editor_app.py"), default_timeout=60)
+    start = time.perf_counter()
+    app.run()
+    first_run_ms = (time.perf_counter() - start) * 1000
+    if app.exception:
+        raise SystemExit(f"editor_app.py raised: {app.exception[0].value}")
+
+    rerun_ms = []
+    for _ in range(reruns):
+        start = time.perf_counter()
+        app.run()
+        rerun_ms.append((time.perf_counter() - start) * 1000)
+
+    imported = set(sys.modules) - before
+    import startup_profile
+    print(json.dumps({
+        "streamlit_import_ms": streamlit_ms,
+        "first_run_ms": first_run_ms,
+        "rerun_ms": statistics.median(rerun_ms) if rerun_ms else 0.0,
+        "heavy_modules": sorted(m for m in imported if m.split(".")[0] in HEAVY_MODULES),
+        "slowest_imports": [[name, total * 1000] for name, total, _ in startup_profile.import_times()[:5]],
+    }))
+
+
+def run_once(reruns):
+    env = dict(os.environ, STARTUP_PROFILE="1")
+    result = subprocess.run(
+        [sys.executable, "-m", "benchmarks.cold_start", "--child", "--reruns", str(reruns)],
+        cwd=ROOT, env=env, capture_output=True, text=True, check=False,
+    )
+    if result.returncode != 0:
+        raise SystemExit(f"Cold-start run failed:\n{result.stderr or result.stdout}")
+    # The app's own output (startup profile) comes first; the result is the last line.
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--runs", type=int, default=5, help="fresh interpreters to start")
+    parser.add_argument("--reruns", type=int, default=10, help="reruns measured per interpreter")
+    parser.add_argument("--json", help="also write the results to this file")
+    parser.add_argument("--max-first-run-ms", type=float, help="budget for the median first script run")
+    parser.add_argument("--max-rerun-ms", type=float, help="budget for the median rerun")
+    parser.add_argument("--child", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.child:
+        child(args.reruns)
+        return 0
+
+    runs = [run_once(args.reruns) for _ in range(args.runs)]
+    summary = {
+        key: statistics.median(run[key] for run in runs)
+        for key in ("streamlit_import_ms", "first_run_ms", "rerun_ms")
+    }
+    heavy = sorted({module for run in runs for module in run["heavy_modules"]})
+
+    print(f"{'streamlit import':<20} {summary['streamlit_import_ms']:10.1f} ms")
+    print(f"{'first run (login)':<20} {summary['first_run_ms']:10.1f} ms")
+    print(f"{'rerun (login)':<20} {summary['rerun_ms']:10.1f} ms")
+    print("\nSlowest first-time imports (last run):")
+    for name, total in runs[-1]["slowest_imports"]:
+        print(f"{total:10.1f} ms  {name}")
+    print(f"\nHeavy modules imported by the login page: {', '.join(heavy) or 'none'}")
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump({"summary": summary, "heavy_modules": heavy, "runs": runs}, f, indent=2)
+
+    failures = []
+    if args.max_first_run_ms is not None and summary["first_run_ms"] > args.max_first_run_ms:
+        failures.append(f"first run {summary['first_run_ms']:.1f} ms > {args.max_first_run_ms} ms")
+    if args.max_rerun_ms is not None and summary["rerun_ms"] > args.max_rerun_ms:
+        failures.append(f"rerun {summary['rerun_ms']:.1f} ms > {args.max_rerun_ms} ms")
+    if (args.max_first_run_ms is not None or args.max_rerun_ms is not None) and heavy:
+        failures.append(f"login page imported {', '.join(heavy)}")
+    for failure in failures:
+        print(f"REGRESSION: {failure}")
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
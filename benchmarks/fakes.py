@@ -0,0 +1,218 @@
+"""
+Network-free stand-ins for the Google Sheets worksheet and the SMTP server.
+
+FakeWorksheet implements the slice of the gspread Worksheet API that
+sheet_manager uses (get, batch_get, append_row, append_rows, update,
+batch_update) on an in-memory grid, with optional per-call latency and
+injected quota errors. SMTPSink is a minimal SMTP server that accepts and
+counts messages.
+"""
+import json
+import re
+import socketserver
+import threading
+import time
+from collections import Counter
+
+import gspread
+
+CELL = re.compile(r"^([A-Z]+)(\d*)$")
+
+
+def _column_index(letters):
+    index = 0
+    for letter in letters:
+        index = index * 26 + ord(letter) - 64
+    return index - 1
+
+
+def _column_letters(index):
+    letters = ""
+    index += 1
+    while index:
+        index, remainder = divmod(index - 1, 26)
+        letters = chr(65 + remainder) + letters
+    return letters
+
+
+class FakeResponse:
+    """Enough of requests.Response for gspread.exceptions.APIError."""
+
+    def __init__(self, status_code, message):
+        self.status_code = status_code
+        self.text = message
+        self._payload = {"error": {"code": status_code, "message": message, "status": "RESOURCE_EXHAUSTED"}}
+
+    def json(self):
+        return self._payload
+
+
+class FakeWorksheet:
+    def __init__(self, rows, latency=0.0, quota_error_every=0):
+        self.rows = [[str(value) for value in row] for row in rows]
+        self.latency = latency
+        self.quota_error_every = quota_error_every
+        self.calls = Counter()
+        self.bytes_read = 0
+        self.bytes_written = 0
+        self._total_calls = 0
+        self._lock = threading.Lock()
+
+    def _call(self, name):
+        with self._lock:
+            self.calls[name] += 1
+            self._total_calls += 1
+            fail = self.quota_error_every and self._total_calls % self.quota_error_every == 0
+        if self.latency:
+            time.sleep(self.latency)
+        if fail:
+            raise gspread.exceptions.APIError(FakeResponse(429, "Quota exceeded (injected)"))
+
+    def _parse_range(self, cell_range):
+        cell_range = cell_range.split("!")[-1]
+        start, _, end = cell_range.partition(":")
+        first_col, first_row = CELL.match(start).groups()
+        last_col, last_row = CELL.match(end or start).groups()
+        return (
+            _column_index(first_col), int(first_row or 1),
+            _column_index(last_col), int(last_row) if last_row else None,
+        )
+
+    def get(self, cell_range):
+        self._call("get")
+        values = self._values(cell_range)
+        self.bytes_read += len(json.dumps(values))
+        return values
+
+    def batch_get(self, ranges, **kwargs):
+        self._call("batch_get")
+        values = [self._values(cell_range) for cell_range in ranges]
+        self.bytes_read += len(json.dumps(values))
+        return values
+
+    def _values(self, cell_range):
+        col0, row0, col1, row1 = self._parse_range(cell_range)
+        with self._lock:
+            selected = self.rows[row0 - 1:row1 if row1 is not None else len(self.rows)]
+            values = []
+            for row in selected:
+                cells = row[col0:col1 + 1]
+                while cells and cells[-1] == "":
+                    cells.pop()
+                values.append(cells)
+        while values and not values[-1]:
+            values.pop()
+        return values
+
+    def append_row(self, values, **kwargs):
+        self._call("append_row")
+        values = [str(value) for value in values]
+        with self._lock:
+            self.rows.append(values)
+            row_num = len(self.rows)
+        self.bytes_written += len(json.dumps(values))
+        return {"updates": {"updatedRange": f"'Datas'!A{row_num}:{_column_letters(len(values) - 1)}{row_num}"}}
+
+    def append_rows(self, values, **kwargs):
+        self._call("append_rows")
+        values = [[str(value) for value in row] for row in values]
+        with self._lock:
+            first = len(self.rows) + 1
+            self.rows.extend(values)
+            last = len(self.rows)
+        self.bytes_written += len(json.dumps(values))
+        width = max((len(row) for row in values), default=1)
+        return {"updates": {"updatedRange": f"'Datas'!A{first}:{_column_letters(width - 1)}{last}"}}
+
+    def update(self, cell_range, values, **kwargs):
+        self._call("update")
+        self._write(cell_range, values)
+
+    def batch_update(self, data, **kwargs):
+        # Like gspread, prefix each range with the sheet name in place before sending.
+        for item in data:
+            item["range"] = f"'Datas'!{item['range']}"
+        self._call("batch_update")
+        for item in data:
+            if item["range"].count("!") > 1:
+                raise gspread.exceptions.APIError(FakeResponse(400, f"Unable to parse range: {item['range']}"))
+        for item in data:
+            self._write(item["range"], item["values"])
+
+    def _write(self, cell_range, values):
+        col0, row0, _, _ = self._parse_range(cell_range)
+        with self._lock:
+            for offset, row_values in enumerate(values):
+                while len(self.rows) < row0 + offset:
+                    self.rows.append([])
+                row = self.rows[row0 + offset - 1]
+                if len(row) < col0 + len(row_values):
+                    row.extend([""] * (col0 + len(row_values) - len(row)))
+                row[col0:col0 + len(row_values)] = [str(value) for value in row_values]
+        self.bytes_written += len(json.dumps(values))
+
+
+class _SMTPHandler(socketserver.StreamRequestHandler):
+    def _reply(self, line):
+        self.wfile.write(line.encode("ascii") + b"\r\n")
+
+    def handle(self):
+        self._reply("220 sink ESMTP")
+        while True:
+            line = self.rfile.readline()
+            if not line:
+                return
+            command = line.decode("ascii", "replace").strip().upper()
+            if command.startswith(("EHLO", "HELO")):
+                self._reply("250 sink")
+            elif command == "DATA":
+                self._reply("354 End data with <CR><LF>.<CR><LF>")
+                size = 0
+                for data_line in iter(self.rfile.readline, b""):
+                    if data_line in (b".\r\n", b".\n"):
+                        break
+                    size += len(data_line)
+                self.server.record(size)
+                self._reply("250 OK")
+            elif command == "QUIT":
+                self._reply("221 Bye")
+                return
+            else:  # MAIL, RCPT, RSET, NOOP
+                self._reply("250 OK")
+
+
+class SMTPSink(socketserver.ThreadingTCPServer):
+    """Local SMTP server that swallows every message (no TLS, no AUTH)."""
+
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, host="127.0.0.1", port=0):
+        super().__init__((host, port), _SMTPHandler)
+        self.messages = 0
+        self.bytes_received = 0
+        self.connections = 0
+        self._lock = threading.Lock()
+        self._thread = threading.Thread(target=self.serve_forever, name="smtp-sink", daemon=True)
+
+    def record(self, size):
+        with self._lock:
+            self.messages += 1
+            self.bytes_received += size
+
+    def process_request(self, request, client_address):
+        with self._lock:
+            self.connections += 1
+        super().process_request(request, client_address)
+
+    @property
+    def port(self):
+        return self.server_address[1]
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
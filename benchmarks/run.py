@@ -0,0 +1,169 @@
+"""
+Offline latency benchmark for the login, registration, 2FA and save paths.
+
+    python -m benchmarks.run --rows 100 10000 100000 --ops 200
+    python -m benchmarks.run --rows 10000 --latency-ms 80 --quota-error-every 50
+    python -m benchmarks.run --backend sqlite --max-p99-ms 5
+    python -m benchmarks.run --rows 10000 --quota-tracker
+
+Drives the real sheet_manager and email_sender functions against a
+FakeWorksheet (or a temporary SQLite database) and a local SMTPSink, then
+prints p50/p99 latency, backend calls and bytes transferred per operation.
+With --max-p99-ms the exit status is 1 when any operation is slower, so the
+run can gate a deploy. Run it from the repository root without a
+.streamlit/secrets.toml that points at real services.
+"""
+import argparse
+import contextlib
+import io
+import json
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+
+# Every benchmark user saves at most a few times; keep the quota out of the way.
+os.environ["MAX_UPLOADS_PER_DAY"] = "1000000"
+
+import email_sender
+import sheet_manager
+from benchmarks.fakes import FakeWorksheet, SMTPSink
+from quota import QuotaTracker
+from storage import COLUMNS, SQLiteStore, hash_password
+
+
+class Recorder:
+    def __init__(self, sheet=None, sink=None):
+        self.sheet = sheet
+        self.sink = sink
+        self.results = []
+
+    def _counters(self):
+        calls = sum(self.sheet.calls.values()) if self.sheet else 0
+        transferred = self.sheet.bytes_read + self.sheet.bytes_written if self.sheet else 0
+        if self.sink:
+            transferred += self.sink.bytes_received
+        return calls, transferred
+
+    def run(self, rows, name, operation, inputs):
+        durations = []
+        calls_before, bytes_before = self._counters()
+        # The app logs with print(); keep it out of the report.
+        with contextlib.redirect_stdout(io.StringIO()):
+            for item in inputs:
+                start = time.perf_counter()
+                operation(item)
+                durations.append(time.perf_counter() - start)
+        calls_after, bytes_after = self._counters()
+        count = len(durations)
+        durations.sort()
+        self.results.append({
+            "rows": rows,
+            "operation": name,
+            "count": count,
+            "p50_ms": statistics.median(durations) * 1000,
+            "p99_ms": durations[min(count - 1, int(count * 0.99))] * 1000,
+            "calls_per_op": (calls_after - calls_before) / count if self.sheet else None,
+            "bytes_per_op": (bytes_after - bytes_before) / count,
+        })
+
+
+def build_users(rows):
+    return [[f"user{i}@bench.local", hash_password(f"pw{i}"), "", "0", "{}"] for i in range(rows)]
+
+
+def build_store(args, users, workdir):
+    if args.backend == "sqlite":
+        store = SQLiteStore(os.path.join(workdir, f"bench-{len(users)}.db"))
+        for email, password_hash, *_ in users:
+            store.register_hashed_user(email, password_hash)
+        return store, None
+    sheet = FakeWorksheet(
+        [COLUMNS] + users,
+        latency=args.latency_ms / 1000,
+        quota_error_every=args.quota_error_every,
+    )
+    factory = lambda: sheet
+    return sheet_manager.SheetsStore(factory=factory, write_behind=args.write_behind), sheet
+
+
+def bench_rows(args, rows, sink, recorder_results, workdir):
+    rng = random.Random(rows)
+    users = build_users(rows)
+    store, sheet = build_store(args, users, workdir)
+    if args.quota_tracker:
+        store.quota = QuotaTracker(int(os.environ["MAX_UPLOADS_PER_DAY"]))
+    sheet_manager.set_store(store)
+    recorder = Recorder(sheet, sink)
+
+    picks = [rng.randrange(rows) for _ in range(args.ops)]
+    recorder.run(rows, "find_user (cold)", lambda i: sheet_manager.find_user(f"user{i}@bench.local"), picks[:1])
+    recorder.run(rows, "find_user", lambda i: sheet_manager.find_user(f"user{i}@bench.local"), picks)
+    recorder.run(rows, "login_user", lambda i: sheet_manager.login_user(f"user{i}@bench.local", f"pw{i}"), picks)
+    recorder.run(rows, "authenticate_user (unknown)", lambda i: sheet_manager.authenticate_user(f"nobody{i}@bench.local", "x"), range(args.ops))
+    recorder.run(rows, "register_user", lambda i: sheet_manager.register_user(f"new{i}@bench.local", "pw"), range(args.ops))
+
+    template = json.load(open("config_template.json", encoding="utf-8"))
+    recorder.run(
+        rows, "save_config",
+        lambda i: sheet_manager.save_config(f"user{i}@bench.local", dict(template, custom_title=f"Bench {rng.random()}")),
+        picks,
+    )
+    recorder.run(rows, "send_2fa_code", lambda i: email_sender.send_2fa_code(f"user{i}@bench.local", "123456"), picks[:args.mail_ops])
+    if getattr(store, "queue", None):
+        store.queue.flush()
+    recorder_results.extend(recorder.results)
+
+
+def print_results(results):
+    header = f"{'rows':>8}  {'operation':<30} {'n':>5} {'p50 ms':>9} {'p99 ms':>9} {'calls/op':>9} {'bytes/op':>11}"
+    print(header)
+    print("-" * len(header))
+    for r in results:
+        calls = "-" if r["calls_per_op"] is None else f"{r['calls_per_op']:.2f}"
+        print(f"{r['rows']:>8}  {r['operation']:<30} {r['count']:>5} {r['p50_ms']:>9.3f} {r['p99_ms']:>9.3f} {calls:>9} {r['bytes_per_op']:>11.0f}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--rows", type=int, nargs="+", default=[100, 10000, 100000])
+    parser.add_argument("--ops", type=int, default=200, help="operations per scenario")
+    parser.add_argument("--mail-ops", type=int, default=50, help="2FA emails per row count")
+    parser.add_argument("--backend", choices=["sheets", "sqlite"], default="sheets")
+    parser.add_argument("--write-behind", action="store_true", help="enable the write-behind save queue")
+    parser.add_argument("--quota-tracker", action="store_true", help="reject users known to be over quota before any backend call")
+    parser.add_argument("--latency-ms", type=float, default=0.0, help="added latency per fake Sheets call")
+    parser.add_argument("--quota-error-every", type=int, default=0, help="fail every Nth Sheets call with HTTP 429")
+    parser.add_argument("--json", help="also write the results to this file")
+    parser.add_argument("--max-p99-ms", type=float, help="exit with status 1 if any operation's p99 exceeds this")
+    args = parser.parse_args(argv)
+
+    sink = SMTPSink().start()
+    settings = {"host": "127.0.0.1", "port": sink.port, "user": None, "password": None,
+                "sender": "bench@bench.local", "starttls": False}
+    email_sender.set_dispatcher(email_sender.MailDispatcher(lambda: email_sender.open_smtp_connection(settings)))
+    os.environ["SMTP_SENDER"] = settings["sender"]
+
+    results = []
+    with tempfile.TemporaryDirectory() as workdir:
+        for rows in args.rows:
+            bench_rows(args, rows, sink, results, workdir)
+    sink.stop()
+
+    print_results(results)
+    print(f"\nSMTP sink: {sink.messages} messages over {sink.connections} connections")
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+    if args.max_p99_ms is not None:
+        slow = [r for r in results if r["p99_ms"] > args.max_p99_ms]
+        for r in slow:
+            print(f"REGRESSION: {r['operation']} at {r['rows']} rows p99 {r['p99_ms']:.3f} ms > {args.max_p99_ms} ms")
+        return 1 if slow else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
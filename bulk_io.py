@@ -0,0 +1,299 @@
+"""
+Bulk export and import of user configs.
+
+Exports stream users page by page from the store (UserStore.iter_users), so
+memory use does not grow with the number of users:
+
+    python bulk_io.py export backup.jsonl     # one JSON object per user
+    python bulk_io.py export configs.zip      # <email>/config.json per user
+
+Imports read the same formats, validate every config and write them back in
+batches (UserStore.write_rows / insert_users). After each batch the number of
+processed entries is stored in a checkpoint file next to the input, so an
+interrupted import continues where it stopped when run again:
+
+    python bulk_io.py import backup.jsonl [--batch-size 100] [--restart]
+
+JSONL exports contain password hashes; keep them private.
+"""
+import argparse
+import hashlib
+import json
+import os
+import zipfile
+from dataclasses import dataclass, field
+import metrics
+from config_codec import encode_config
+from config_model import validate_config
+from sheet_manager import create_store
+from storage import COLUMNS, email_key, parse_config
+from utils import is_valid_email
+
+ZIP_CONFIG_NAME = "config.json"
+MAX_REPORTED_ERRORS = 100
+
+
+def export_record(user):
+    return {
+        "email": user["Email"],
+        "password": user["Password"],
+        "last_upload": user["LastUpload"],
+        "upload_count": int(user["UploadCount"] or 0),
+        "config": parse_config(user),
+    }
+
+
+def export_jsonl(store, out, progress=None):
+    """Write one JSON line per user to the text file `out`; returns the count."""
+    count = 0
+    for _, user in store.iter_users():
+        out.write(json.dumps(export_record(user), ensure_ascii=False) + "\n")
+        count += 1
+        if progress:
+            progress(count, None)
+    return count
+
+
+def export_zip(store, out, progress=None):
+    """Write <email>/config.json per user into the binary file `out`; returns the count."""
+    count = 0
+    with zipfile.ZipFile(out, "w", zipfile.ZIP_DEFLATED) as archive:
+        for _, user in store.iter_users():
+            config = json.dumps(parse_config(user), indent=2, ensure_ascii=False)
+            archive.writestr(f"{user['Email'].strip()}/{ZIP_CONFIG_NAME}", config)
+            count += 1
+            if progress:
+                progress(count, None)
+    return count
+
+
+def read_entries(path):
+    """Yield (position, entry, error) for every entry of a JSONL file or config zip."""
+    if zipfile.is_zipfile(path):
+        with zipfile.ZipFile(path) as archive:
+            names = [name for name in archive.namelist() if name.endswith("/" + ZIP_CONFIG_NAME)]
+            for position, name in enumerate(names):
+                email = name.split("/")[-2]
+                try:
+                    yield position, {"email": email, "config": json.loads(archive.read(name))}, None
+                except ValueError as e:
+                    yield position, None, f"{name}: invalid JSON ({e})"
+        return
+    with open(path, encoding="utf-8") as f:
+        for position, line in enumerate(f):
+            if not line.strip():
+                yield position, None, None
+                continue
+            try:
+                yield position, json.loads(line), None
+            except ValueError as e:
+                yield position, None, f"line {position + 1}: invalid JSON ({e})"
+
+
+def count_entries(path):
+    if zipfile.is_zipfile(path):
+        with zipfile.ZipFile(path) as archive:
+            return sum(name.endswith("/" + ZIP_CONFIG_NAME) for name in archive.namelist())
+    with open(path, encoding="utf-8") as f:
+        return sum(1 for _ in f)
+
+
+def file_digest(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+@dataclass
+class ImportReport:
+    processed: int = 0
+    updated: int = 0
+    created: int = 0
+    resumed_from: int = 0
+    error_count: int = 0
+    errors: list = field(default_factory=list)
+
+    def error(self, message):
+        self.error_count += 1
+        if len(self.errors) < MAX_REPORTED_ERRORS:
+            self.errors.append(message)
+
+
+def _check_entry(entry):
+    """(email, normalized config, None) for a valid entry, else (None, None, error)."""
+    if not isinstance(entry, dict):
+        return None, None, "entry is not a JSON object"
+    email = str(entry.get("email", "")).strip()
+    if not is_valid_email(email):
+        return None, None, f"invalid email {email!r}"
+    if not isinstance(entry.get("config"), dict):
+        return None, None, f"{email}: config is not a JSON object"
+    model, problems = validate_config(entry["config"])
+    if problems:
+        return None, None, f"{email}: " + "; ".join(problems[:3])
+    return email, model.to_dict(), None
+
+
+class _Checkpoint:
+    """Entries of an input file already imported, persisted next to it."""
+
+    def __init__(self, path, digest):
+        self.path = path
+        self.digest = digest
+
+    def load(self):
+        try:
+            with open(self.path, encoding="utf-8") as f:
+                state = json.load(f)
+        except (OSError, ValueError):
+            return 0
+        if state.get("sha256") != self.digest:
+            print(f"Ignoring checkpoint {self.path}: it belongs to a different input file.")
+            return 0
+        return int(state.get("done", 0))
+
+    def save(self, done):
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"sha256": self.digest, "done": done}, f)
+        os.replace(tmp_path, self.path)
+
+    def clear(self):
+        try:
+            os.remove(self.path)
+        except FileNotFoundError:
+            pass
+
+
+def _record_history(store, configs):
+    # Imported configs become versions too, so a bad import can be rolled back.
+    # Upload quotas are left alone: a restore is not the user's upload.
+    if store.history is None:
+        return
+    for email, config in configs:
+        try:
+            store.history.record(email, config)
+        except Exception as e:
+            print(f"Failed to record config history for {email}: {e}")
+
+
+def import_configs(store, path, batch_size=100, checkpoint_path=None, restart=False, progress=None):
+    """
+    Import a JSONL export or config zip into `store`; returns an ImportReport.
+
+    Existing users get the entry's config (and, from JSONL, its upload
+    counters); unknown users are created when the entry has a password hash.
+    Invalid entries are skipped and reported. Each batch is written before
+    the checkpoint moves past it, so a failed batch is retried on resume.
+    """
+    checkpoint = _Checkpoint(checkpoint_path or f"{path}.progress", file_digest(path))
+    if restart:
+        checkpoint.clear()
+    report = ImportReport(resumed_from=checkpoint.load())
+    total = count_entries(path)
+
+    existing = {}
+    for row_id, user in store.iter_users():
+        # Configs are replaced anyway; not keeping them bounds memory per user.
+        user["Config"] = ""
+        existing.setdefault(email_key(user["Email"]), (row_id, user))
+
+    batch = []
+
+    def commit(done):
+        updates, inserts, configs = {}, {}, {}
+        for email, config, entry in batch:
+            key = email_key(email)
+            configs[key] = (email, config)
+            values = {"Config": encode_config(config)}
+            if "last_upload" in entry:
+                values["LastUpload"] = str(entry["last_upload"])
+            if "upload_count" in entry:
+                values["UploadCount"] = str(entry["upload_count"])
+            if key in existing:
+                row_id, user = existing[key]
+                updates[key] = (row_id, {**user, **values})
+            elif key in inserts or entry.get("password"):
+                base = inserts.get(key) or dict(zip(COLUMNS, [email, entry.get("password"), "", "0", "{}"]))
+                inserts[key] = {**base, **values}
+            else:
+                report.error(f"{email}: no such user and no password hash to create it")
+        written = store.write_rows(list(updates.values())) if updates else []
+        for key, row_id in zip(list(updates), written):
+            if row_id is None:
+                report.error(f"{updates[key][1]['Email']}: user was deleted during the import, not imported")
+                del existing[key]
+            else:
+                existing[key] = (row_id, existing[key][1])
+        row_ids = store.insert_users(list(inserts.values())) if inserts else []
+        for (key, record), row_id in zip(inserts.items(), row_ids):
+            if row_id is None:
+                report.error(f"{record['Email']}: already exists, not imported")
+            else:
+                existing[key] = (row_id, record)
+        _record_history(store, [value for key, value in configs.items() if key in existing])
+        report.updated += sum(row_id is not None for row_id in written)
+        report.created += sum(row_id is not None for row_id in row_ids)
+        report.processed = done
+        checkpoint.save(done)
+        batch.clear()
+        if progress:
+            progress(done, total)
+
+    for position, entry, error in read_entries(path):
+        if position < report.resumed_from:
+            continue
+        if error:
+            report.error(error)
+        elif entry is not None:
+            email, config, error = _check_entry(entry)
+            if error:
+                report.error(f"entry {position + 1}: {error}")
+            else:
+                batch.append((email, config, entry))
+        if len(batch) >= batch_size:
+            commit(position + 1)
+    commit(total)
+    checkpoint.clear()
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Export or import all user configs.")
+    commands = parser.add_subparsers(dest="command", required=True)
+    export = commands.add_parser("export", help="write every user to a .jsonl or .zip file")
+    export.add_argument("output")
+    load = commands.add_parser("import", help="import a .jsonl export or a config .zip")
+    load.add_argument("input")
+    load.add_argument("--batch-size", type=int, default=100)
+    load.add_argument("--restart", action="store_true", help="ignore the checkpoint of an earlier run")
+    args = parser.parse_args()
+
+    store = create_store()
+
+    def report_progress(done, total):
+        print(f"\r{done}/{total}" if total else f"\r{done}", end="", flush=True)
+
+    if args.command == "export":
+        with metrics.action("export"):
+            if args.output.endswith(".zip"):
+                with open(args.output, "wb") as out:
+                    count = export_zip(store, out, report_progress)
+            else:
+                with open(args.output, "w", encoding="utf-8") as out:
+                    count = export_jsonl(store, out, report_progress)
+        print(f"\nExported {count} users to {args.output}")
+    else:
+        with metrics.action("import"):
+            report = import_configs(store, args.input, args.batch_size, restart=args.restart, progress=report_progress)
+        if report.resumed_from:
+            print(f"\nResumed after entry {report.resumed_from}.")
+        print(f"\nUpdated {report.updated}, created {report.created}, {report.error_count} errors.")
+        for error in report.errors:
+            print(f"  {error}")
+
+
+if __name__ == "__main__":
+    main()
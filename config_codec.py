@@ -0,0 +1,36 @@
+import base64
+import json
+import zlib
+
+# Versioned prefix of compressed configs. Anything else is plain JSON, which
+# is also how every row written before this format looks.
+COMPRESSED_PREFIX = "z1:"
+
+
+def encode_config(config: dict) -> str:
+    """
+    Serialize a config as compact JSON, or as zlib + base64 behind the
+    COMPRESSED_PREFIX when that is shorter (anything but tiny configs).
+    """
+    text = json.dumps(config, separators=(",", ":"), ensure_ascii=False)
+    packed = COMPRESSED_PREFIX + base64.b64encode(zlib.compress(text.encode("utf-8"), 9)).decode("ascii")
+    return packed if len(packed) < len(text) else text
+
+
+def decode_config(stored: str) -> dict:
+    """Inverse of encode_config; raises ValueError on malformed input."""
+    if stored.startswith(COMPRESSED_PREFIX):
+        try:
+            raw = zlib.decompress(base64.b64decode(stored[len(COMPRESSED_PREFIX):], validate=True))
+        except Exception as e:
+            raise ValueError(f"Corrupt compressed config: {e}") from e
+        return json.loads(raw.decode("utf-8"))
+    return json.loads(stored)
+
+
+def split_cells(stored: str, cell_limit: int, max_cells: int) -> list:
+    """Split an encoded config over `max_cells` cells, padding with ""."""
+    cells = [stored[i:i + cell_limit] for i in range(0, len(stored), cell_limit)] or [""]
+    if len(cells) > max_cells:
+        raise ValueError(f"Config is too large to store ({len(stored)} characters).")
+    return cells + [""] * (max_cells - len(cells))
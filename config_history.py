@@ -0,0 +1,215 @@
+"""
+Version history of every saved config, kept apart from the users table.
+
+Each accepted save appends a version keyed by its config_hash. Most versions
+store only a delta against the previous one; every HISTORY_SNAPSHOT_EVERY-th
+version (or whenever the delta would be larger) stores the full config, so
+rebuilding any version applies at most that many deltas. Versions beyond
+HISTORY_MAX_VERSIONS per user or older than HISTORY_MAX_AGE_DAYS are
+dropped, turning the oldest kept version into a snapshot first.
+
+History is a local SQLite file. With the SQLite backend it goes into the
+users database; with Google Sheets it is off unless HISTORY_DB_PATH names a
+file, which should be on storage that every app host shares and that
+survives redeploys. Otherwise each host would keep its own partial history
+and lose it on redeploy.
+"""
+import copy
+import json
+import sqlite3
+import threading
+import time
+from dataclasses import dataclass
+from utils import config_hash, get_setting, get_flag
+
+
+@dataclass
+class Version:
+    version: int
+    config_hash: str
+    saved_at: float
+    snapshot: bool
+
+
+def diff_configs(old, new):
+    """Delta turning `old` into `new`: {"set": [[path, value], ...], "unset": [path, ...]}."""
+    delta = {"set": [], "unset": []}
+
+    def walk(a, b, path):
+        if isinstance(a, dict) and isinstance(b, dict):
+            for key, value in b.items():
+                if key in a:
+                    walk(a[key], value, path + [key])
+                else:
+                    delta["set"].append([path + [key], value])
+            delta["unset"].extend(path + [key] for key in a if key not in b)
+        elif a != b:
+            delta["set"].append([path, b])
+
+    walk(old, new, [])
+    return delta
+
+
+def apply_delta(config, delta):
+    config = copy.deepcopy(config)
+    for path, value in delta["set"]:
+        if not path:
+            return copy.deepcopy(value)
+        target = config
+        for key in path[:-1]:
+            target = target.setdefault(key, {})
+        target[path[-1]] = value
+    for path in delta["unset"]:
+        target = config
+        for key in path[:-1]:
+            target = target.get(key, {})
+        target.pop(path[-1], None)
+    return config
+
+
+class ConfigHistory:
+    """Append-only config versions in a SQLite database (WAL mode)."""
+
+    def __init__(self, path="history.db", snapshot_every=10, max_versions=50, max_age_days=180):
+        self._path = path
+        self._snapshot_every = max(1, snapshot_every)
+        self._max_versions = max(1, max_versions)
+        self._max_age = max_age_days * 86400
+        self._local = threading.local()
+        conn = self._conn()
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute(
+            """CREATE TABLE IF NOT EXISTS config_versions (
+                email TEXT NOT NULL COLLATE NOCASE,
+                version INTEGER NOT NULL,
+                config_hash TEXT NOT NULL,
+                saved_at REAL NOT NULL,
+                snapshot INTEGER NOT NULL,
+                data TEXT NOT NULL,
+                PRIMARY KEY (email, version)
+            )"""
+        )
+
+    def _conn(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self._path, timeout=30, isolation_level=None)
+            conn.row_factory = sqlite3.Row
+            self._local.conn = conn
+        return conn
+
+    def record(self, email, config, previous=None):
+        """
+        Append `config` as the user's newest version; returns its number, or
+        None if it equals the newest one. On a user's first record, `previous`
+        (the config being replaced) becomes version 1 so it can be restored.
+        """
+        email = email.strip()
+        digest = config_hash(config)
+        conn = self._conn()
+        # BEGIN IMMEDIATE serializes version numbering across processes.
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            latest = conn.execute(
+                "SELECT version, config_hash FROM config_versions WHERE email = ? ORDER BY version DESC LIMIT 1",
+                (email,),
+            ).fetchone()
+            if latest is None:
+                base, chain, number = None, 0, 1
+                if previous is not None and config_hash(previous) != digest:
+                    self._insert(conn, email, 1, previous, snapshot=True)
+                    base, number = previous, 2
+            elif latest["config_hash"] == digest:
+                conn.execute("COMMIT")
+                return None
+            else:
+                number = latest["version"] + 1
+                base, chain = self._materialize(conn, email, latest["version"])
+
+            delta = None if base is None or chain + 1 >= self._snapshot_every else diff_configs(base, config)
+            if delta is None or len(json.dumps(delta)) >= len(json.dumps(config)):
+                self._insert(conn, email, number, config, snapshot=True)
+            else:
+                self._insert(conn, email, number, delta, snapshot=False, digest=digest)
+            self._compact(conn, email, number)
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        return number
+
+    def versions(self, email):
+        """The user's versions, newest first."""
+        rows = self._conn().execute(
+            "SELECT version, config_hash, saved_at, snapshot FROM config_versions WHERE email = ? ORDER BY version DESC",
+            (email.strip(),),
+        ).fetchall()
+        return [Version(row["version"], row["config_hash"], row["saved_at"], bool(row["snapshot"])) for row in rows]
+
+    def config_at(self, email, version):
+        """The config saved as `version`, or None if it is not kept."""
+        config, _ = self._materialize(self._conn(), email.strip(), version)
+        return config
+
+    def _insert(self, conn, email, number, data, snapshot, digest=None):
+        conn.execute(
+            "INSERT INTO config_versions (email, version, config_hash, saved_at, snapshot, data) VALUES (?, ?, ?, ?, ?, ?)",
+            (email, number, digest or config_hash(data), time.time(), int(snapshot),
+             json.dumps(data, separators=(",", ":"), ensure_ascii=False)),
+        )
+
+    def _materialize(self, conn, email, version):
+        """(config, number of deltas applied) for `version`; (None, 0) if missing."""
+        rows = conn.execute(
+            """SELECT version, snapshot, data FROM config_versions
+               WHERE email = ? AND version <= ? AND version >= (
+                   SELECT MAX(version) FROM config_versions WHERE email = ? AND version <= ? AND snapshot = 1
+               ) ORDER BY version""",
+            (email, version, email, version),
+        ).fetchall()
+        if not rows or rows[-1]["version"] != version:
+            return None, 0
+        config = json.loads(rows[0]["data"])
+        for row in rows[1:]:
+            config = apply_delta(config, json.loads(row["data"]))
+        return config, len(rows) - 1
+
+    def _compact(self, conn, email, latest):
+        keep_from = latest - self._max_versions + 1
+        newest_expired = conn.execute(
+            "SELECT MAX(version) FROM config_versions WHERE email = ? AND saved_at < ?",
+            (email, time.time() - self._max_age),
+        ).fetchone()[0]
+        if newest_expired is not None:
+            keep_from = max(keep_from, min(newest_expired + 1, latest))  # Never drop the newest
+        first = conn.execute("SELECT MIN(version) FROM config_versions WHERE email = ?", (email,)).fetchone()[0]
+        if first >= keep_from:
+            return
+        oldest = conn.execute(
+            "SELECT version, snapshot FROM config_versions WHERE email = ? AND version >= ? ORDER BY version LIMIT 1",
+            (email, keep_from),
+        ).fetchone()
+        if not oldest["snapshot"]:
+            # The versions it is a delta against are about to go.
+            config, _ = self._materialize(conn, email, oldest["version"])
+            conn.execute(
+                "UPDATE config_versions SET snapshot = 1, data = ? WHERE email = ? AND version = ?",
+                (json.dumps(config, separators=(",", ":"), ensure_ascii=False), email, oldest["version"]),
+            )
+        conn.execute("DELETE FROM config_versions WHERE email = ? AND version < ?", (email, oldest["version"]))
+
+
+def create_history(default_path=None):
+    """
+    History store from the HISTORY_* settings, kept in HISTORY_DB_PATH or else
+    `default_path`. None with HISTORY_ENABLED off or without either path.
+    """
+    path = get_setting("HISTORY_DB_PATH") or default_path
+    if not path or not get_flag("HISTORY_ENABLED", True):
+        return None
+    return ConfigHistory(
+        path,
+        snapshot_every=int(get_setting("HISTORY_SNAPSHOT_EVERY", 10)),
+        max_versions=int(get_setting("HISTORY_MAX_VERSIONS", 50)),
+        max_age_days=float(get_setting("HISTORY_MAX_AGE_DAYS", 180)),
+    )
@@ -0,0 +1,278 @@
+"""
+Typed model of a display config, mirroring config_template.json.
+
+Each section is a small __slots__ class described by a FIELDS schema.
+`Config.from_dict` validates and normalizes a raw dict in one pass:
+missing keys get their defaults, numbers are coerced and clamped to the
+ranges the editor allows, and every problem is reported with its path.
+"""
+import math
+import re
+
+HEX_COLOR = re.compile(r"^#[0-9a-fA-F]{6}$")
+
+
+class Field:
+    __slots__ = ("name", "kind", "default", "minimum", "maximum", "choices")
+
+    def __init__(self, name, kind, default=None, minimum=None, maximum=None, choices=None):
+        self.name = name
+        self.kind = kind
+        self.default = default
+        self.minimum = minimum
+        self.maximum = maximum
+        self.choices = choices
+
+    def make_default(self):
+        if isinstance(self.kind, type) and issubclass(self.kind, Section):
+            return self.kind()
+        return list(self.default) if isinstance(self.default, list) else self.default
+
+    def normalize(self, value, path, problems):
+        kind = self.kind
+        if isinstance(kind, type) and issubclass(kind, Section):
+            if not isinstance(value, dict):
+                problems.append(f"{path}: expected an object")
+                return kind()
+            return kind.from_dict(value, path, problems)
+        if kind is bool:
+            if isinstance(value, bool):
+                return value
+            problems.append(f"{path}: expected true or false")
+            return self.default
+        if kind is int:
+            if isinstance(value, bool) or not isinstance(value, (int, float)):
+                try:
+                    value = int(str(value).strip())
+                except ValueError:
+                    problems.append(f"{path}: expected a number")
+                    return self.default
+            elif isinstance(value, float):
+                # json accepts NaN, Infinity and 1e400; none of them is a setting.
+                if not math.isfinite(value) or not value.is_integer():
+                    problems.append(f"{path}: expected a whole number")
+                    return self.default
+                value = int(value)
+            if self.minimum is not None and value < self.minimum or self.maximum is not None and value > self.maximum:
+                problems.append(f"{path}: must be between {self.minimum} and {self.maximum}")
+                return min(max(value, self.minimum), self.maximum)
+            return value
+        if kind == "color":
+            if isinstance(value, str) and HEX_COLOR.match(value):
+                return value.lower()
+            problems.append(f"{path}: expected a #rrggbb color")
+            return self.default
+        if kind == "str_list":
+            if not isinstance(value, list):
+                problems.append(f"{path}: expected a list")
+                return list(self.default)
+            return [str(item).strip() for item in value if str(item).strip()]
+        # Plain strings
+        if not isinstance(value, str):
+            problems.append(f"{path}: expected text")
+            return self.default
+        if self.choices and value not in self.choices:
+            problems.append(f"{path}: must be one of {', '.join(self.choices)}")
+            return self.default
+        return value
+
+
+class Section:
+    __slots__ = ()
+    FIELDS = ()
+
+    def __init__(self, **values):
+        for field in self.FIELDS:
+            setattr(self, field.name, values[field.name] if field.name in values else field.make_default())
+
+    @classmethod
+    def from_dict(cls, data, path="", problems=None):
+        problems = [] if problems is None else problems
+        section = cls.__new__(cls)
+        for field in cls.FIELDS:
+            field_path = f"{path}.{field.name}" if path else field.name
+            if field.name in data:
+                value = field.normalize(data[field.name], field_path, problems)
+            else:
+                value = field.make_default()
+            setattr(section, field.name, value)
+        return section
+
+    def to_dict(self):
+        result = {}
+        for field in self.FIELDS:
+            value = getattr(self, field.name)
+            result[field.name] = value.to_dict() if isinstance(value, Section) else value
+        return result
+
+    def __eq__(self, other):
+        return type(self) is type(other) and all(
+            getattr(self, field.name) == getattr(other, field.name) for field in self.FIELDS
+        )
+
+    def __repr__(self):
+        return f"{type(self).__name__}({self.to_dict()!r})"
+
+
+def _slots(fields):
+    return tuple(field.name for field in fields)
+
+
+class Layout(Section):
+    FIELDS = (
+        Field("view", str, "grid", choices=("grid", "list")),
+        Field("columns_per_row", int, 3, 1, 5),
+        Field("stop_order", "str_list", []),
+        Field("padding_between_cards", int, 16, 0, 64),
+        Field("card_border_radius", int, 12, 0, 30),
+    )
+    __slots__ = _slots(FIELDS)
+
+
+DISPLAY_FLAGS = (
+    "show_wheelchair_icon", "show_stop_location", "highlight_soon_departures", "show_stop_code",
+    "show_direction", "show_stop_name", "group_by_direction", "show_route_short_name", "use_24h_time",
+)
+
+
+class Display(Section):
+    FIELDS = (
+        Field("departures_per_stop", int, 5, 1, 10),
+        Field("max_departure_age_seconds", int, 180, 30, 600),
+    ) + tuple(Field(flag, bool, False) for flag in DISPLAY_FLAGS)
+    __slots__ = _slots(FIELDS)
+
+
+class FontSpec(Section):
+    FIELDS = (
+        Field("family", str, "Roboto"),
+        Field("size", int, 16, 10, 40),
+        Field("weight", str, "normal"),
+    )
+    __slots__ = _slots(FIELDS)
+
+
+def _font_spec(name, size, max_size, weight, family="Roboto"):
+    """FontSpec variant with its own defaults and size range."""
+    fields = (
+        Field("family", str, family),
+        Field("size", int, size, 10, max_size),
+        Field("weight", str, weight),
+    )
+    return type(name, (FontSpec,), {"__slots__": (), "FIELDS": fields})
+
+
+class Fonts(Section):
+    FIELDS = (
+        Field("title", _font_spec("TitleFont", 32, 100, "bold")),
+        Field("subtitle", _font_spec("SubtitleFont", 24, 60, "normal")),
+        Field("text", _font_spec("TextFont", 16, 40, "normal")),
+        Field("time", _font_spec("TimeFont", 20, 60, "medium", family="Roboto Mono")),
+    )
+    __slots__ = _slots(FIELDS)
+
+
+class ClockStyle(Section):
+    FIELDS = (
+        Field("font_family", str, "Roboto"),
+        Field("font_size", int, 20, 10, 60),
+        Field("font_weight", str, "bold"),
+        Field("text_color", "color", "#333333"),
+    )
+    __slots__ = _slots(FIELDS)
+
+
+class Colors(Section):
+    FIELDS = (
+        Field("text", "color", "#000000"),
+        Field("title_text", "color", "#000000"),
+        Field("subtitle_text", "color", "#444444"),
+        Field("clock_text", "color", "#333333"),
+        Field("background", "color", "#ffffff"),
+        Field("card_background", "color", "#f8f8f8"),
+        Field("card_border", "color", "#dddddd"),
+        Field("highlight_departure", "color", "#ff0000"),
+    )
+    __slots__ = _slots(FIELDS)
+
+
+class Emojis(Section):
+    FIELDS = (
+        Field("bus", str, "🚍"),
+        Field("tram", str, "🚋"),
+        Field("metro", str, "🚇"),
+    )
+    __slots__ = _slots(FIELDS)
+
+
+class Style(Section):
+    FIELDS = (
+        Field("color_by_route", bool, True),
+        Field("card_shadow", bool, True),
+        Field("card_border", bool, True),
+        Field("fonts", Fonts),
+        Field("clock", ClockStyle),
+        Field("colors", Colors),
+        Field("custom_emojis", Emojis),
+    )
+    __slots__ = _slots(FIELDS)
+
+
+CLOCK_POSITIONS = ("top-left", "top-right", "bottom-left", "bottom-right")
+
+
+class Clock(Section):
+    FIELDS = (
+        Field("show", bool, True),
+        Field("position", str, "top-right", choices=CLOCK_POSITIONS),
+    )
+    __slots__ = _slots(FIELDS)
+
+
+class HighlightZone(Section):
+    FIELDS = (
+        Field("enabled", bool, True),
+        Field("minutes_threshold", int, 5, 1, 30),
+        Field("max_items", int, 3, 1, 10),
+        Field("font_size", int, 22, 10, 40),
+        Field("font_family", str, "Roboto"),
+        Field("text_color", "color", "#ff6600"),
+        Field("show_route_icon", bool, True),
+        Field("show_countdown", bool, True),
+    )
+    __slots__ = _slots(FIELDS)
+
+
+class Config(Section):
+    FIELDS = (
+        Field("custom_title", str, ""),
+        Field("refresh_interval_seconds", int, 30, 5, 120),
+        Field("layout", Layout),
+        Field("display", Display),
+        Field("style", Style),
+        Field("clock", Clock),
+        Field("top_highlight_zone", HighlightZone),
+    )
+    __slots__ = _slots(FIELDS)
+
+
+def validate_config(data):
+    """Return (Config, problems) for a raw config dict."""
+    problems = []
+    if not isinstance(data, dict):
+        return Config(), ["config: expected an object"]
+    return Config.from_dict(data, "", problems), problems
+
+
+def changed_sections(old, new, path=""):
+    """Sorted names of the sections whose own values differ, e.g. ["layout", "style.fonts.title"]."""
+    changed = set()
+    for field in new.FIELDS:
+        old_value, new_value = getattr(old, field.name), getattr(new, field.name)
+        if old_value == new_value:
+            continue
+        if isinstance(new_value, Section):
+            changed.update(changed_sections(old_value, new_value, f"{path}.{field.name}" if path else field.name))
+        else:
+            changed.add(path or "general")
+    return sorted(changed)
@@ -0,0 +1,238 @@
+"""
+Read-only HTTP endpoint serving published configs to the departure displays.
+
+Configs are served from an in-memory cache that is rebuilt from the store
+with one bulk read every CONFIG_REFRESH_SECONDS, so kiosk polling never
+reaches Google Sheets. Saves made through the same store (the editor, when
+the server runs inside the Streamlit process) update the cache and wake
+waiting kiosks at once; saves from other processes show up with the next
+refresh, up to CONFIG_REFRESH_SECONDS later. Each response carries the
+config_hash as its ETag:
+
+    GET /config/<email>                     -> 200 with the config JSON
+    GET /config/<email>  If-None-Match: ... -> 304 while it is unchanged
+    GET /config/<email>?wait=30             -> with If-None-Match, holds the
+                                               request until the config
+                                               changes or 30s pass
+    GET /metrics                            -> Prometheus metrics
+
+Run standalone with `python config_server.py`, or set CONFIG_SERVER_PORT
+to start it inside the Streamlit process.
+
+Configs are keyed by email, so a 404 tells a caller that an email is not
+registered. That is accepted: display configs hold no secrets, kiosks are
+set up with their owner's email anyway, and the server listens on
+localhost unless CONFIG_SERVER_HOST says otherwise.
+"""
+import argparse
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, unquote, urlsplit
+import streamlit as st
+import metrics
+from sheet_manager import create_store, get_store
+from storage import email_key, parse_config
+from utils import config_hash, get_setting
+
+DEFAULT_PORT = 8502
+REFRESH_SECONDS = 30
+MAX_WAIT_SECONDS = 60
+
+
+class ConfigCache:
+    """email -> (ETag, JSON body) of every stored config, refreshed in bulk."""
+
+    def __init__(self, store, refresh_seconds=REFRESH_SECONDS):
+        self._store = store
+        self._refresh_seconds = refresh_seconds
+        self._entries = {}
+        self._published = {}  # email key -> time of the last publish()
+        self._changed = threading.Condition()
+        self._stop = threading.Event()
+        self._thread = None
+        self.refreshed_at = None
+
+    def refresh(self):
+        started = time.time()
+        with metrics.trace("config_cache.refresh"):
+            users = self._store.all_users()
+        previous = self._entries
+        entries = {}
+        for user in users:
+            key = email_key(user["Email"])
+            if not key or key in entries:
+                continue
+            cached = previous.get(key)
+            if cached and cached[0] == user["Config"]:
+                entries[key] = cached  # Stored value unchanged, skip decoding it
+                continue
+            entries[key] = _entry(user["Config"], parse_config(user))
+        with self._changed:
+            # Saves published while the bulk read ran are newer than what it returned.
+            for key, published_at in self._published.items():
+                if published_at >= started and key in self._entries:
+                    entries[key] = self._entries[key]
+            self._published = {key: at for key, at in self._published.items() if at >= started}
+            self._entries = entries
+            self.refreshed_at = time.time()
+            self._changed.notify_all()
+
+    def publish(self, email, config, stored):
+        """Serve a just-saved config and wake its waiting kiosks (a UserStore save listener)."""
+        key = email_key(email)
+        entry = _entry(stored, config)
+        with self._changed:
+            self._entries[key] = entry
+            self._published[key] = time.time()
+            self._changed.notify_all()
+
+    def get(self, email):
+        """(etag, body) of the user's config, or None if the email is unknown."""
+        entry = self._entries.get(email_key(email))
+        return entry[1:] if entry else None
+
+    def wait(self, email, etags, timeout):
+        """Block until the user's ETag is not in `etags` or `timeout` passes; return get()."""
+        key = email_key(email)
+
+        def changed():
+            entry = self._entries.get(key)
+            return entry is None or entry[1] not in etags
+
+        with self._changed:
+            self._changed.wait_for(changed, timeout)
+        return self.get(email)
+
+    def start(self):
+        self._thread = threading.Thread(target=self._refresh_loop, name="config-cache-refresh", daemon=True)
+        self._thread.start()
+
+    def close(self):
+        self._stop.set()
+        with self._changed:
+            self._changed.notify_all()
+
+    def _refresh_loop(self):
+        while not self._stop.is_set():
+            try:
+                self.refresh()
+            except Exception as e:
+                print(f"Config cache refresh failed, serving previous configs: {e}")
+            self._stop.wait(self._refresh_seconds)
+
+
+def _entry(stored, config):
+    body = json.dumps(config, ensure_ascii=False, indent=2).encode("utf-8")
+    return stored, f'"{config_hash(config)}"', body
+
+
+def _etags(header):
+    """Entity tags listed in an If-None-Match header (weak tags compare as strong)."""
+    if not header:
+        return set()
+    return {tag.strip().removeprefix("W/") for tag in header.split(",") if tag.strip()}
+
+
+class ConfigRequestHandler(BaseHTTPRequestHandler):
+    server_version = "BKKConfig/1.0"
+
+    def do_GET(self):
+        url = urlsplit(self.path)
+        with metrics.action("kiosk"):
+            if url.path == "/metrics":
+                self._send(200, metrics.render_prometheus().encode("utf-8"), "text/plain; version=0.0.4")
+            elif url.path.startswith("/config/"):
+                with metrics.trace("config_server.get"):
+                    self._serve_config(unquote(url.path[len("/config/"):]), parse_qs(url.query))
+            else:
+                self._send(404, b"Not found\n", "text/plain")
+
+    def _serve_config(self, email, query):
+        cache = self.server.cache
+        if cache.refreshed_at is None:
+            self._send(503, b"Configs are not loaded yet\n", "text/plain", {"Retry-After": "5"})
+            return
+        etags = _etags(self.headers.get("If-None-Match"))
+        entry = cache.get(email)
+        if entry and entry[0] in etags and "wait" in query:
+            try:
+                wait = min(float(query["wait"][0]), MAX_WAIT_SECONDS)
+            except ValueError:
+                wait = 0
+            if wait > 0:
+                entry = cache.wait(email, etags, wait)
+        if entry is None:
+            self._send(404, b"Unknown user\n", "text/plain")
+            return
+        etag, body = entry
+        headers = {"ETag": etag, "Cache-Control": "no-cache"}
+        if etag in etags or "*" in etags:
+            self._send(304, b"", None, headers)
+        else:
+            self._send(200, body, "application/json; charset=utf-8", headers)
+
+    def _send(self, status, body, content_type, headers=None):
+        self.send_response(status)
+        if content_type:
+            self.send_header("Content-Type", content_type)
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        if status != 304:
+            self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        if body:
+            self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass  # Kiosks poll constantly; request counts are in /metrics
+
+
+def create_server(store, host="127.0.0.1", port=DEFAULT_PORT, refresh_seconds=REFRESH_SECONDS):
+    """HTTP server over a started ConfigCache of `store` (available as `server.cache`)."""
+    server = ThreadingHTTPServer((host, port), ConfigRequestHandler)
+    server.daemon_threads = True
+    server.cache = ConfigCache(store, refresh_seconds)
+    store.save_listeners.append(server.cache.publish)
+    server.cache.start()
+    return server
+
+
+@st.cache_resource
+def start_config_server():
+    """Serve configs from this process when CONFIG_SERVER_PORT is set."""
+    port = get_setting("CONFIG_SERVER_PORT")
+    if not port:
+        return None
+    server = create_server(
+        get_store(),
+        host=get_setting("CONFIG_SERVER_HOST", "127.0.0.1"),
+        port=int(port),
+        refresh_seconds=float(get_setting("CONFIG_REFRESH_SECONDS", REFRESH_SECONDS)),
+    )
+    threading.Thread(target=server.serve_forever, name="config-server", daemon=True).start()
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve published display configs over HTTP.")
+    parser.add_argument("--host", default=get_setting("CONFIG_SERVER_HOST", "127.0.0.1"))
+    parser.add_argument("--port", type=int, default=int(get_setting("CONFIG_SERVER_PORT", DEFAULT_PORT)))
+    parser.add_argument("--refresh", type=float, default=float(get_setting("CONFIG_REFRESH_SECONDS", REFRESH_SECONDS)),
+                        help="seconds between bulk cache refreshes")
+    args = parser.parse_args()
+
+    server = create_server(create_store(), args.host, args.port, args.refresh)
+    print(f"Serving configs on http://{args.host}:{args.port}/config/<email>")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.cache.close()
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,7 +1,13 @@
+import time
+_run_started = time.perf_counter()
+
 import streamlit as st
+import startup_profile
+startup_profile.install()
+
+import metrics
 from ui_auth import login_ui
-from ui_editor import show_config_editor
-from utils import config_hash
+from utils import config_hash, get_setting
 
 st.set_page_config(page_title="BKK Config Editor", layout="centered")
 
@@ -12,20 +18,32 @@ default_states = {
     "config": {},
     "uploaded_config": None,
     "config_key_suffix": "default",
-    "awaiting_2fa": False,
-    "pending_email": "",
-    "pending_password": "",
-    "generated_code": "",
-    "code_sent_time": 0,
+    "pending_token": "",
+    "mail_job_id": "",
 }
 
 for key, default_value in default_states.items():
     if key not in st.session_state:
         st.session_state[key] = default_value
 
+metrics.start_file_exporter()
+if get_setting("CONFIG_SERVER_PORT"):
+    from config_server import start_config_server
+    start_config_server()
+
 # --- Auth or Editor View ---
-if not st.session_state.logged_in:
-    login_ui()
-    st.stop()
-else:
-    show_config_editor()
+# The editor and admin pages (and what they import) load after login only.
+try:
+    if not st.session_state.logged_in:
+        with metrics.action("render"), metrics.trace("streamlit.render_login"):
+            login_ui()
+    else:
+        from ui_admin import show_admin_panel, is_admin
+        if is_admin(st.session_state.email) and st.sidebar.radio("Page", ["Editor", "Admin"]) == "Admin":
+            show_admin_panel()
+        else:
+            from ui_editor import show_config_editor
+            with metrics.action("render"), metrics.trace("streamlit.render_editor"):
+                show_config_editor()
+finally:
+    startup_profile.finish_run(_run_started)
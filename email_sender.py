@@ -1,34 +1,242 @@
-import smtplib
-import ssl
-from email.message import EmailMessage
+import queue
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from typing import TYPE_CHECKING
 import streamlit as st
+from metrics import action, current_action, trace, traced
+from utils import get_setting, get_flag
 
-def send_2fa_code(to_email: str, code: str) -> bool:
-    """
-    Send a 6-digit 2FA code email using SMTP2Go via credentials in Streamlit secrets.
-    Returns True on success, False on failure.
-    """
+if TYPE_CHECKING:
+    # Annotations only; smtplib and email are imported when a mail is sent.
+    import smtplib
+    from email.message import EmailMessage
+
+# How many finished jobs to remember for status polling.
+MAX_TRACKED_JOBS = 1000
+
+
+def smtp_settings() -> dict:
+    return {
+        "host": get_setting("SMTP_HOST"),
+        "port": int(get_setting("SMTP_PORT", 587)),
+        "user": get_setting("SMTP_USER"),
+        "password": get_setting("SMTP_PASSWORD"),
+        "sender": get_setting("SMTP_SENDER"),
+        # Plain local stand-ins (aiosmtpd, `python -m smtpd`) speak neither TLS nor AUTH.
+        "starttls": get_flag("SMTP_STARTTLS", True),
+    }
 
-    smtp_host = st.secrets["SMTP_HOST"]
-    smtp_port = st.secrets.get("SMTP_PORT", 587)
-    smtp_user = st.secrets["SMTP_USER"]
-    smtp_pass = st.secrets["SMTP_PASSWORD"]
-    sender_email = st.secrets["SMTP_SENDER"]
 
+def is_permanent_error(error) -> bool:
+    """Reply codes that will not change on a retry (bad recipient, auth failure, ...)."""
+    import smtplib
+    return isinstance(error, (smtplib.SMTPRecipientsRefused, smtplib.SMTPSenderRefused, smtplib.SMTPAuthenticationError))
+
+
+@traced("smtp.connect")
+def open_smtp_connection(settings: dict) -> "smtplib.SMTP":
+    # smtplib, ssl and email are imported on first use; rendering the login page needs none of them.
+    import smtplib
+    import ssl
+    server = smtplib.SMTP(settings["host"], settings["port"], timeout=30)
+    try:
+        if settings["starttls"]:
+            server.starttls(context=ssl.create_default_context())
+        if settings["user"]:
+            server.login(settings["user"], settings["password"])
+    except Exception:
+        server.close()
+        raise
+    return server
+
+
+def build_2fa_message(sender_email: str, to_email: str, code: str) -> "EmailMessage":
+    from email.message import EmailMessage
     message = EmailMessage()
     message["Subject"] = "Your 2FA Verification Code"
     message["From"] = sender_email
     message["To"] = to_email
     message.set_content(f"Your verification code is: {code}")
+    return message
 
-    context = ssl.create_default_context()
 
-    try:
-        with smtplib.SMTP(smtp_host, smtp_port) as server:
-            server.starttls(context=context)
-            server.login(smtp_user, smtp_pass)
-            server.send_message(message)
-        return True
-    except Exception as e:
-        print(f"Failed to send 2FA email: {e}")
-        return False
+class MailJob:
+    """Status handle for a queued email: queued -> sending -> sent | failed."""
+
+    def __init__(self, message: "EmailMessage"):
+        self.id = uuid.uuid4().hex
+        self.message = message
+        self.status = "queued"
+        self.error = None
+        self.attempts = 0
+        self.action = current_action()  # Metrics are attributed to the action that queued it
+        self._done = threading.Event()
+
+    @property
+    def done(self) -> bool:
+        return self._done.is_set()
+
+    def wait(self, timeout=None) -> bool:
+        """Block until the job finished; True if it was sent."""
+        self._done.wait(timeout)
+        return self.status == "sent"
+
+    def _finish(self, status, error=None):
+        self.status = status
+        self.error = error
+        self._done.set()
+
+
+class MailDispatcher:
+    """
+    Sends email from a bounded queue on a small pool of worker threads.
+
+    Each worker keeps its own authenticated SMTP connection open between
+    messages, checks it with NOOP after `keepalive_seconds` of idleness,
+    closes it after `idle_timeout` seconds without work and reconnects on
+    failure. Transient errors are retried with exponential backoff.
+    """
+
+    def __init__(self, connect, workers=2, max_queue=100, max_attempts=3, backoff=1.0,
+                 keepalive_seconds=30, idle_timeout=120):
+        self._connect = connect
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._max_attempts = max_attempts
+        self._backoff = backoff
+        self._keepalive_seconds = keepalive_seconds
+        self._idle_timeout = idle_timeout
+        self._jobs = OrderedDict()
+        self._jobs_lock = threading.Lock()
+        self._workers = [
+            threading.Thread(target=self._work, name=f"mail-dispatcher-{i}", daemon=True)
+            for i in range(workers)
+        ]
+        for worker in self._workers:
+            worker.start()
+
+    def submit(self, message: "EmailMessage") -> MailJob:
+        job = MailJob(message)
+        self._track(job)
+        try:
+            self._queue.put_nowait(job)
+        except queue.Full:
+            job._finish("failed", "Mail queue is full.")
+        return job
+
+    def job(self, job_id):
+        with self._jobs_lock:
+            return self._jobs.get(job_id)
+
+    def _track(self, job):
+        with self._jobs_lock:
+            self._jobs[job.id] = job
+            while len(self._jobs) > MAX_TRACKED_JOBS:
+                oldest_id = next(iter(self._jobs))
+                if not self._jobs[oldest_id].done:
+                    break
+                del self._jobs[oldest_id]
+
+    def _work(self):
+        server = None
+        last_used = 0.0
+        while True:
+            try:
+                job = self._queue.get(timeout=self._idle_timeout)
+            except queue.Empty:
+                server = self._close(server)
+                continue
+            with action(job.action):
+                if server is not None and time.monotonic() - last_used > self._keepalive_seconds:
+                    server = self._check_alive(server)
+                server = self._deliver(job, server)
+            last_used = time.monotonic()
+            self._queue.task_done()
+
+    def _deliver(self, job, server):
+        job.status = "sending"
+        for attempt in range(self._max_attempts):
+            job.attempts = attempt + 1
+            try:
+                if server is None:
+                    server = self._connect()
+                with trace("smtp.send"):
+                    server.send_message(job.message)
+                job._finish("sent")
+                return server
+            except Exception as e:
+                server = self._close(server)
+                if is_permanent_error(e) or attempt == self._max_attempts - 1:
+                    print(f"Failed to send email: {e}")
+                    job._finish("failed", str(e))
+                    return server
+                time.sleep(self._backoff * 2 ** attempt)
+        return server
+
+    def _check_alive(self, server):
+        try:
+            with trace("smtp.noop"):
+                reply = server.noop()
+            if reply[0] == 250:
+                return server
+        except Exception:
+            pass
+        return self._close(server)
+
+    @staticmethod
+    def _close(server):
+        if server is not None:
+            try:
+                server.quit()
+            except Exception:
+                server.close()
+        return None
+
+
+_dispatcher_override = None
+
+
+def set_dispatcher(dispatcher):
+    """Use `dispatcher` instead of the one built from SMTP settings (benchmarks, tests)."""
+    global _dispatcher_override
+    _dispatcher_override = dispatcher
+
+
+def get_dispatcher() -> MailDispatcher:
+    return _dispatcher_override or _configured_dispatcher()
+
+
+@st.cache_resource
+def _configured_dispatcher() -> MailDispatcher:
+    settings = smtp_settings()
+    return MailDispatcher(
+        lambda: open_smtp_connection(settings),
+        workers=int(get_setting("SMTP_WORKERS", 2)),
+        max_queue=int(get_setting("SMTP_MAX_QUEUE", 100)),
+    )
+
+
+@traced("mail.queue_2fa_code")
+def queue_2fa_code(to_email: str, code: str) -> MailJob:
+    """
+    Queue a 6-digit 2FA code email (SMTP2Go via credentials in Streamlit
+    secrets) and return its status handle without waiting for delivery.
+    """
+    message = build_2fa_message(get_setting("SMTP_SENDER"), to_email, code)
+    return get_dispatcher().submit(message)
+
+
+def mail_status(job_id):
+    """Status of a queued email ("queued", "sending", "sent", "failed"), or None if unknown."""
+    job = get_dispatcher().job(job_id) if job_id else None
+    return job.status if job else None
+
+
+@traced("mail.send_2fa_code")
+def send_2fa_code(to_email: str, code: str, timeout: float = 30) -> bool:
+    """
+    Send a 6-digit 2FA code email and wait for the result.
+    Returns True on success, False on failure.
+    """
+    return queue_2fa_code(to_email, code).wait(timeout)
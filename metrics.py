@@ -0,0 +1,235 @@
+"""
+Lightweight tracing of backend calls.
+
+Spans are aggregated per (user action, operation) into call counts, errors,
+durations and payload sizes. The user action is a context variable set by
+the UI around each button handler, so a slow "login" can be broken down
+into its Sheets and SMTP calls. With METRICS_ENABLED off, `trace` returns a
+shared no-op span and `traced` wrappers call straight through.
+"""
+import contextlib
+import contextvars
+import functools
+import os
+import threading
+import time
+import streamlit as st
+from utils import get_setting, get_flag
+
+# Upper bounds (seconds) of the Prometheus duration histogram buckets.
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+_enabled = get_flag("METRICS_ENABLED", True)
+_lock = threading.Lock()
+_stats = {}
+_action = contextvars.ContextVar("bkk_user_action", default="background")
+
+
+class _Stat:
+    __slots__ = ("count", "errors", "seconds", "max_seconds", "bytes", "buckets")
+
+    def __init__(self):
+        self.count = 0
+        self.errors = 0
+        self.seconds = 0.0
+        self.max_seconds = 0.0
+        self.bytes = 0
+        self.buckets = [0] * len(BUCKETS)
+
+
+def is_enabled():
+    return _enabled
+
+
+def set_enabled(enabled):
+    global _enabled
+    _enabled = bool(enabled)
+
+
+def current_action():
+    return _action.get()
+
+
+@contextlib.contextmanager
+def action(name):
+    """Attribute every span inside the block to the user action `name`."""
+    token = _action.set(name)
+    try:
+        yield
+    finally:
+        _action.reset(token)
+
+
+def record(operation, seconds, size=0, error=False):
+    key = (_action.get(), operation)
+    with _lock:
+        stat = _stats.get(key)
+        if stat is None:
+            stat = _stats[key] = _Stat()
+        stat.count += 1
+        stat.errors += error
+        stat.seconds += seconds
+        stat.max_seconds = max(stat.max_seconds, seconds)
+        stat.bytes += size
+        for i, bound in enumerate(BUCKETS):
+            if seconds <= bound:
+                stat.buckets[i] += 1
+                break
+
+
+class _Span:
+    __slots__ = ("operation", "bytes", "_start")
+
+    def __init__(self, operation):
+        self.operation = operation
+        self.bytes = 0
+
+    def __enter__(self):
+        self._start = time.perf_counter()
+        return self
+
+    def measure(self, values):
+        self.bytes += payload_size(values)
+
+    def __exit__(self, exc_type, exc, tb):
+        # Streamlit's rerun/stop signals are BaseExceptions, not errors.
+        error = exc_type is not None and issubclass(exc_type, Exception)
+        record(self.operation, time.perf_counter() - self._start, self.bytes, error)
+        return False
+
+
+class _NoSpan:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def measure(self, values):
+        pass
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+
+_NO_SPAN = _NoSpan()
+
+
+def trace(operation):
+    """Context manager timing one backend call; `.measure(payload)` adds its size."""
+    return _Span(operation) if _enabled else _NO_SPAN
+
+
+def traced(operation):
+    """Decorator form of `trace` for whole functions."""
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if not _enabled:
+                return func(*args, **kwargs)
+            with _Span(operation):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def payload_size(values):
+    """Approximate size in characters of a cell grid, row or string."""
+    if isinstance(values, str):
+        return len(values)
+    if isinstance(values, (list, tuple)):
+        return sum(payload_size(value) for value in values)
+    return len(str(values))
+
+
+def snapshot():
+    with _lock:
+        items = sorted(_stats.items())
+        return [
+            {
+                "action": user_action,
+                "operation": operation,
+                "calls": stat.count,
+                "errors": stat.errors,
+                "total_ms": round(stat.seconds * 1000, 3),
+                "avg_ms": round(stat.seconds * 1000 / stat.count, 3),
+                "max_ms": round(stat.max_seconds * 1000, 3),
+                "bytes": stat.bytes,
+            }
+            for (user_action, operation), stat in items
+        ]
+
+
+def reset():
+    with _lock:
+        _stats.clear()
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _labels(user_action, operation, **extra):
+    pairs = {"action": user_action, "operation": operation, **extra}
+    return ",".join(f'{key}="{_escape(value)}"' for key, value in pairs.items())
+
+
+def render_prometheus():
+    """All metrics in the Prometheus text exposition format."""
+    with _lock:
+        items = sorted(_stats.items())
+        lines = [
+            "# HELP bkk_backend_calls_total Backend calls per user action and operation.",
+            "# TYPE bkk_backend_calls_total counter",
+        ]
+        lines += [f"bkk_backend_calls_total{{{_labels(*key)}}} {stat.count}" for key, stat in items]
+        lines += [
+            "# HELP bkk_backend_errors_total Backend calls that raised.",
+            "# TYPE bkk_backend_errors_total counter",
+        ]
+        lines += [f"bkk_backend_errors_total{{{_labels(*key)}}} {stat.errors}" for key, stat in items]
+        lines += [
+            "# HELP bkk_backend_payload_bytes_total Approximate payload characters sent or received.",
+            "# TYPE bkk_backend_payload_bytes_total counter",
+        ]
+        lines += [f"bkk_backend_payload_bytes_total{{{_labels(*key)}}} {stat.bytes}" for key, stat in items]
+        lines += [
+            "# HELP bkk_backend_duration_seconds Backend call duration.",
+            "# TYPE bkk_backend_duration_seconds histogram",
+        ]
+        for key, stat in items:
+            cumulative = 0
+            for bound, count in zip(BUCKETS, stat.buckets):
+                cumulative += count
+                lines.append(f"bkk_backend_duration_seconds_bucket{{{_labels(*key, le=bound)}}} {cumulative}")
+            lines.append(f"bkk_backend_duration_seconds_bucket{{{_labels(*key, le='+Inf')}}} {stat.count}")
+            lines.append(f"bkk_backend_duration_seconds_sum{{{_labels(*key)}}} {stat.seconds:.6f}")
+            lines.append(f"bkk_backend_duration_seconds_count{{{_labels(*key)}}} {stat.count}")
+    return "\n".join(lines) + "\n"
+
+
+def write_prometheus_file(path):
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        f.write(render_prometheus())
+    os.replace(tmp_path, path)  # Scrapers never see a half-written file
+
+
+@st.cache_resource
+def start_file_exporter():
+    """Rewrite METRICS_FILE every METRICS_FILE_INTERVAL seconds (for node_exporter's textfile collector)."""
+    path = get_setting("METRICS_FILE")
+    if not path:
+        return None
+    interval = float(get_setting("METRICS_FILE_INTERVAL", 15))
+
+    def loop():
+        while True:
+            time.sleep(interval)
+            try:
+                write_prometheus_file(path)
+            except OSError as e:
+                print(f"Failed to write metrics file: {e}")
+
+    thread = threading.Thread(target=loop, name="metrics-file-exporter", daemon=True)
+    thread.start()
+    return thread
@@ -0,0 +1,63 @@
+"""
+Fast rejection of saves over the daily upload quota (MAX_UPLOADS_PER_DAY).
+
+The quota itself is counted in each user's row (LastUpload/UploadCount) by
+storage.next_upload. QuotaTracker remembers today's count from the rows a
+save reads and writes anyway, so a user already known to be over the limit
+is turned away before any backend call. It adds no I/O, is per process and
+starts empty: it can only refuse saves the row would refuse too.
+"""
+import threading
+from datetime import date, datetime
+from storage import email_key
+from utils import get_setting, get_flag
+
+
+def _day(value):
+    """Date ordinal of an ISO timestamp, or None if it isn't one."""
+    try:
+        return datetime.fromisoformat(value).date().toordinal()
+    except (TypeError, ValueError):
+        return None
+
+
+def _count(value):
+    try:
+        return int(value or 0)
+    except ValueError:
+        return 0
+
+
+class QuotaTracker:
+    def __init__(self, limit):
+        self.limit = limit
+        self._counts = {}  # email key -> (day ordinal, count)
+        self._lock = threading.Lock()
+
+    @property
+    def message(self):
+        return f"Daily upload limit reached ({self.limit}/day)."
+
+    def check(self, email):
+        """Error message if the user is known to be over today's quota, else None. No I/O."""
+        entry = self._counts.get(email_key(email))
+        if entry and entry[0] == date.today().toordinal() and entry[1] >= self.limit:
+            return self.message
+        return None
+
+    def observe(self, email, user):
+        """Remember today's upload count from a user row that was just read or written."""
+        day = _day(user.get("LastUpload"))
+        key = email_key(email)
+        with self._lock:
+            if day == date.today().toordinal():
+                self._counts[key] = (day, _count(user.get("UploadCount")))
+            else:
+                self._counts.pop(key, None)
+
+
+def create_quota_tracker():
+    """Tracker from the settings, or None with QUOTA_TRACKER off."""
+    if not get_flag("QUOTA_TRACKER", True):
+        return None
+    return QuotaTracker(int(get_setting("MAX_UPLOADS_PER_DAY", 10)))
@@ -0,0 +1,121 @@
+import atexit
+import threading
+import time
+
+# Longest wait between retries of a failing save.
+MAX_BACKOFF_SECONDS = 300
+
+
+class SaveQueue:
+    """
+    Write-behind buffer for config saves.
+
+    Only the latest accepted version per user is kept; a daemon thread hands
+    everything that piled up since the last tick to `write_rows` as one batch
+    of (key, row_num, values) triples. `write_rows` returns {key: error} for
+    saves that can never be written (their user is gone); those are dropped.
+
+    When a batch fails it is split in halves and retried, so one bad row
+    cannot hold back everyone else's saves. Saves that still fail are retried
+    with exponential backoff (up to MAX_BACKOFF_SECONDS) unless a newer save
+    for the same user replaces them. Whatever is still pending is flushed
+    when the process exits.
+    """
+
+    def __init__(self, write_rows, interval=2.0, max_batch=200):
+        self._write_rows = write_rows
+        self._interval = interval
+        self._max_batch = max_batch
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._latest = {}   # key -> (row_num, values, version), until flushed
+        self._dirty = set()
+        self._versions = {}
+        self._errors = {}
+        self._dropped = {}  # key -> error of a save that was given up on
+        self._failures = {}  # key -> consecutive failed attempts
+        self._retry_at = {}  # key -> time.monotonic() before which it is not retried
+        self._stop = threading.Event()
+        self._worker = threading.Thread(target=self._run, name="config-save-queue", daemon=True)
+        self._worker.start()
+        atexit.register(self.close)
+
+    def submit(self, key, row_num, values):
+        with self._lock:
+            version = self._versions.get(key, 0) + 1
+            self._versions[key] = version
+            self._latest[key] = (row_num, list(values), version)
+            self._dirty.add(key)
+            self._dropped.pop(key, None)
+            self._retry_at.pop(key, None)  # A new save is worth trying right away
+        return version
+
+    def pending(self, key):
+        """Values accepted for `key` that have not reached the backend yet."""
+        with self._lock:
+            entry = self._latest.get(key)
+        return entry[1] if entry else None
+
+    def status(self, key):
+        with self._lock:
+            if key in self._dropped:
+                return "dropped"
+            if key not in self._latest:
+                return "flushed" if key in self._versions else None
+            return "failed" if key in self._errors else "pending"
+
+    def last_error(self, key):
+        with self._lock:
+            return self._dropped.get(key) or self._errors.get(key)
+
+    def flush(self, force=False):
+        """Write every queued save; with `force`, also those waiting out a backoff."""
+        with self._flush_lock:
+            now = time.monotonic()
+            with self._lock:
+                keys = [key for key in self._dirty if force or self._retry_at.get(key, 0) <= now]
+                batch = [(key, self._latest[key]) for key in keys]
+                self._dirty.difference_update(keys)
+            for start in range(0, len(batch), self._max_batch):
+                self._flush_chunk(batch[start:start + self._max_batch])
+
+    def close(self):
+        self._stop.set()
+        self.flush(force=True)
+
+    def _flush_chunk(self, chunk):
+        try:
+            dropped = self._write_rows([(key, row_num, values) for key, (row_num, values, _) in chunk]) or {}
+        except Exception as e:
+            if len(chunk) > 1:
+                middle = len(chunk) // 2
+                self._flush_chunk(chunk[:middle])
+                self._flush_chunk(chunk[middle:])
+                return
+            self._failed(chunk[0][0], e)
+            return
+        with self._lock:
+            for key, (_, _, version) in chunk:
+                self._errors.pop(key, None)
+                self._failures.pop(key, None)
+                self._retry_at.pop(key, None)
+                if self._latest.get(key, (None, None, 0))[2] != version:
+                    continue  # A newer save is queued and gets its own attempt
+                del self._latest[key]
+                if key in dropped:
+                    print(f"Dropping background config save for {key}: {dropped[key]}")
+                    self._dropped[key] = dropped[key]
+
+    def _failed(self, key, error):
+        with self._lock:
+            failures = self._failures.get(key, 0) + 1
+            delay = min(self._interval * 2 ** failures, MAX_BACKOFF_SECONDS)
+            print(f"Background config save for {key} failed, retrying in {delay:.0f}s: {error}")
+            self._failures[key] = failures
+            self._retry_at[key] = time.monotonic() + delay
+            self._errors[key] = str(error)
+            self._dirty.add(key)
+
+    def _run(self):
+        while not self._stop.wait(self._interval):
+            self.flush()
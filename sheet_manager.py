@@ -1,98 +1,544 @@
-import hashlib
 import json
+import threading
+import time
 import streamlit as st
-from datetime import datetime, date
-import gspread
-from oauth2client.service_account import ServiceAccountCredentials
+from config_codec import split_cells
+from config_history import create_history
+from quota import create_quota_tracker
+from metrics import trace, traced
+from save_queue import SaveQueue
+from storage import (
+    COLUMNS, SAVE_COLUMNS, ConflictError, UserStore, SQLiteStore,
+    email_key, hash_password, parse_config,
+)
+from utils import get_setting, get_flag
 
 SHEET_NAME = "UsersAndConfigs"
 WORKSHEET_NAME = "users"
+SPREADSHEET_KEY = "1BcOHJxaSAh5uGrS9y0jEMoKDlEDUXHfWtPIQGaXH1U4"
+DATA_WORKSHEET = "Datas"
+SCOPE = ["https://spreadsheets.google.com/feeds", "https://www.googleapis.com/auth/drive"]
+
+# Service account tokens live for an hour; re-authorize well before that.
+TOKEN_REFRESH_SECONDS = 45 * 60
+REFRESH_CHECK_SECONDS = 60
+# 401 means our token went stale, the rest are Google-side hiccups or rate limits.
+TRANSIENT_STATUS_CODES = {401, 429, 500, 502, 503, 504}
+# Status codes where Google rejected the request before applying it.
+REJECTED_STATUS_CODES = {401, 429}
+# Only a stale token needs a new worksheet; rate limits and 5xx just back off.
+REAUTH_STATUS_CODES = {401}
+MAX_RETRIES = 3
+
+# Row 1 of the users worksheet is the header, columns A..D follow COLUMNS.
+# The encoded config starts in E and overflows into F..H when it doesn't fit
+# into one cell (Sheets caps cells at 50,000 characters).
+CONFIG_CELLS = 4
+CELL_CHAR_LIMIT = 50000
+LAST_COLUMN = "H"
 
 # Setup credentials and open sheet
-def get_sheet():
-    scope = ["https://spreadsheets.google.com/feeds", "https://www.googleapis.com/auth/drive"]
+@traced("sheets.authorize")
+def open_worksheet():
+    # The Google client stack is imported on first use, not at app start.
+    import gspread
+    from oauth2client.service_account import ServiceAccountCredentials
     json_data = json.loads(st.secrets["SERVICE_ACCOUNT_JSON"])
-    creds = ServiceAccountCredentials.from_json_keyfile_dict(json_data, scope)
+    creds = ServiceAccountCredentials.from_json_keyfile_dict(json_data, SCOPE)
     client = gspread.authorize(creds)
-    sheet = client.open_by_key("1BcOHJxaSAh5uGrS9y0jEMoKDlEDUXHfWtPIQGaXH1U4").worksheet("Datas")
-    return sheet
+    return client.open_by_key(SPREADSHEET_KEY).worksheet(DATA_WORKSHEET)
 
-def hash_password(password):
-    return hashlib.sha256(password.encode()).hexdigest()
+def _status_code(error):
+    response = getattr(error, "response", None)
+    return getattr(response, "status_code", None)
 
-def find_user(email):
-    try:
-        sheet = get_sheet()
-        records = sheet.get_all_records()
-        for i, row in enumerate(records, start=2):
-            if row["Email"].strip().lower() == email.strip().lower():
-                return i, row
-        return None, None
-    except Exception as e:
-        print(f"Error finding user: {e}")
-        return None, None
+def _is_transient(error, idempotent):
+    import gspread
+    import requests
+    if isinstance(error, gspread.exceptions.APIError):
+        codes = TRANSIENT_STATUS_CODES if idempotent else REJECTED_STATUS_CODES
+        return _status_code(error) in codes
+    if isinstance(error, (requests.exceptions.ConnectionError, requests.exceptions.Timeout)):
+        # The request may have reached Google, so only replay safe operations.
+        return idempotent
+    return False
 
-def register_user(email, password):
-    sheet = get_sheet()
-    row_num, existing = find_user(email)
-    if existing:
-        return None, "exists"  # User exists
-    hashed = hash_password(password)
-    now = datetime.now().isoformat()
-    sheet.append_row([email, hashed, now, 0, "{}"])
-    return find_user(email)  # Return newly created user info
+class SheetPool:
+    """Process-wide, thread-safe holder of the authorized worksheet.
 
-def login_user(email, password):
-    row_num, user = find_user(email)
-    if not user:
-        return False, "User not found.", None
-    if hash_password(password) != user["Password"]:
-        return False, "Incorrect password.", None
-    return True, "Login successful.", row_num
+    The worksheet is opened once and shared by every session. A daemon thread
+    re-authorizes in the background before the OAuth token expires, so user
+    actions never pay for the handshake.
+    """
+
+    def __init__(self, factory=open_worksheet, refresh_seconds=TOKEN_REFRESH_SECONDS):
+        self._factory = factory
+        self._refresh_seconds = refresh_seconds
+        self._lock = threading.Lock()
+        self._sheet = None
+        self._opened_at = 0.0
+        self._stop = threading.Event()
+        self._refresher = threading.Thread(target=self._refresh_loop, name="sheet-token-refresh", daemon=True)
+        self._refresher.start()
+
+    def worksheet(self):
+        with self._lock:
+            if self._sheet is None:
+                self._sheet = self._factory()
+                self._opened_at = time.monotonic()
+            return self._sheet
+
+    def reset(self, stale=None):
+        """Drop the cached worksheet so the next call reconnects.
+
+        If `stale` is given, only drop it when it is still the current one,
+        so concurrent failures don't discard a connection another thread
+        has just rebuilt.
+        """
+        with self._lock:
+            if stale is None or self._sheet is stale:
+                self._sheet = None
+
+    def run(self, operation, idempotent=True, retries=MAX_RETRIES):
+        """Run `operation(sheet)` on the pooled worksheet.
+
+        Transient HTTP errors retry with backoff, re-authorizing first only
+        after a 401. Operations that are not idempotent (appends) are only
+        replayed when Google rejected the request outright.
+        """
+        for attempt in range(retries):
+            sheet = self.worksheet()
+            try:
+                return operation(sheet)
+            except Exception as e:
+                if attempt == retries - 1 or not _is_transient(e, idempotent):
+                    raise
+                print(f"Transient Sheets error, retrying (attempt {attempt + 1}): {e}")
+                if _status_code(e) in REAUTH_STATUS_CODES:
+                    self.reset(stale=sheet)
+                time.sleep(0.5 * 2 ** attempt)
+
+    def close(self):
+        self._stop.set()
+
+    def _refresh_loop(self):
+        while not self._stop.wait(REFRESH_CHECK_SECONDS):
+            with self._lock:
+                if self._sheet is None or time.monotonic() - self._opened_at < self._refresh_seconds:
+                    continue
+            try:
+                fresh = self._factory()
+            except Exception as e:
+                print(f"Background Sheets re-authorization failed: {e}")
+                continue
+            with self._lock:
+                self._sheet = fresh
+                self._opened_at = time.monotonic()
+
+def _row_to_record(values):
+    values = list(values) + [""] * (len(COLUMNS) - 1 + CONFIG_CELLS - len(values))
+    record = dict(zip(COLUMNS[:-1], values))
+    record["Config"] = "".join(values[len(COLUMNS) - 1:])
+    return record
+
+def _save_cells(values):
+    """Expand SAVE_COLUMNS values into the cells of columns C..H."""
+    last_upload, upload_count, config_str = values
+    return [last_upload, upload_count] + split_cells(config_str, CELL_CHAR_LIMIT, CONFIG_CELLS)
+
+def _appended_row_number(response):
+    # append_row answers with e.g. {"updates": {"updatedRange": "Datas!A12:E12"}}
+    updated_range = response["updates"]["updatedRange"]
+    first_cell = updated_range.split("!")[-1].split(":")[0]
+    return int("".join(ch for ch in first_cell if ch.isdigit()))
+
+class UserIndex:
+    """In-process email -> (row number, record) index of the users worksheet.
+
+    Built once from a single range read, then kept fresh by fetching only the
+    rows appended since the last sync (every `ttl` seconds, or on a lookup
+    miss) and by a full rebuild every `full_refresh` seconds to pick up edits
+    made directly in the spreadsheet. Local writes update entries in place.
+    Reads happen outside the index lock: lookups keep using the current rows
+    while one thread syncs, and only wait when there is nothing to serve yet.
+    """
+
+    def __init__(self, read_range, ttl=60, full_refresh=600, miss_resync=2):
+        self._read_range = read_range
+        self._ttl = ttl
+        self._full_refresh = full_refresh
+        self._miss_resync = miss_resync
+        self._lock = threading.Lock()
+        self._sync_lock = threading.Lock()  # One backend read at a time
+        self._rows = {}
+        self._puts = None  # Entries put while a rebuild is reading, reapplied after it
+        self._last_row = 1
+        self._built_at = None
+        self._synced_at = 0.0
+        self._generation = 0  # Bumped by invalidate(), so a rebuild racing it doesn't count
+
+    def lookup(self, email):
+        key = email_key(email)
+        self._ensure_fresh()
+        with self._lock:
+            hit = self._rows.get(key)
+        if hit is None and time.monotonic() - self._synced_at > self._miss_resync:
+            with self._sync_lock:
+                if time.monotonic() - self._synced_at > self._miss_resync:
+                    self._sync_tail()
+            with self._lock:
+                hit = self._rows.get(key)
+        if hit is None:
+            return None, None
+        row_num, record = hit
+        return row_num, dict(record)
+
+    def put(self, row_num, record):
+        entry = (row_num, dict(record))
+        with self._lock:
+            self._rows[email_key(record["Email"])] = entry
+            if self._puts is not None:
+                self._puts[email_key(record["Email"])] = entry
+            self._last_row = max(self._last_row, row_num)
+
+    def invalidate(self):
+        with self._lock:
+            self._built_at = None
+            self._generation += 1
+
+    def _ensure_fresh(self):
+        if self._built_at is None:
+            with self._sync_lock:
+                if self._built_at is None:
+                    self._rebuild()
+            return
+        now = time.monotonic()
+        if now - self._built_at > self._full_refresh:
+            sync = self._rebuild
+        elif now - self._synced_at > self._ttl:
+            sync = self._sync_tail
+        else:
+            return
+        if self._sync_lock.acquire(blocking=False):  # Someone else is already syncing
+            try:
+                sync()
+            except Exception as e:
+                print(f"User index sync failed, serving cached rows: {e}")
+            finally:
+                self._sync_lock.release()
+
+    def _rebuild(self):
+        with self._lock:
+            self._puts = {}
+            generation = self._generation
+        try:
+            values = self._read_range(f"A2:{LAST_COLUMN}")
+        except Exception:
+            with self._lock:
+                self._puts = None
+            raise
+        rows = {}
+        last_row = _add_rows(rows, values, start=2)
+        with self._lock:
+            rows.update(self._puts)  # Local writes are at least as new as the read
+            self._rows = rows
+            self._puts = None
+            self._last_row = max(last_row, 1)
+            self._synced_at = time.monotonic()
+            if generation == self._generation:
+                self._built_at = self._synced_at
+
+    def _sync_tail(self):
+        start = self._last_row + 1
+        values = self._read_range(f"A{start}:{LAST_COLUMN}")
+        with self._lock:
+            self._last_row = max(self._last_row, _add_rows(self._rows, values, start=start))
+            self._synced_at = time.monotonic()
+
+def _add_rows(rows, values, start):
+    """Add worksheet rows to an index map; returns the last row number read."""
+    last_row = start - 1
+    for row_num, row in enumerate(values, start=start):
+        last_row = row_num
+        record = _row_to_record(row)
+        if record["Email"].strip():
+            # Like the old linear scan, the first row for an email wins.
+            rows.setdefault(email_key(record["Email"]), (row_num, record))
+    return last_row
+
+class SheetsStore(UserStore):
+    """
+    Users in the Google Sheets "Datas" worksheet, one row per user.
 
-def save_config(email, config_json):
-    sheet = get_sheet()
-    row_num, user = find_user(email)
+    Lookups are served from a UserIndex; with WRITE_BEHIND_SAVES enabled,
+    saves are acknowledged once queued and flushed in batches.
+    """
 
-    if not user or not row_num:
-        return False, "User not found or invalid row number."
+    def __init__(self, factory=open_worksheet, write_behind=False):
+        super().__init__()
+        self.pool = SheetPool(factory)
+        self.index = UserIndex(
+            self._read_range,
+            ttl=float(get_setting("USER_INDEX_TTL_SECONDS", 60)),
+            full_refresh=float(get_setting("USER_INDEX_FULL_REFRESH_SECONDS", 600)),
+        )
+        self.queue = None
+        if write_behind:
+            self.queue = SaveQueue(self._flush_saves, interval=float(get_setting("WRITE_BEHIND_INTERVAL_SECONDS", 2)))
 
-    today = date.today().isoformat()
-    last_upload_raw = user.get("LastUpload", "")
-    last_upload_date = last_upload_raw.split("T")[0] if "T" in last_upload_raw else ""
+    def _read_range(self, cell_range):
+        def read(sheet):
+            with trace("sheets.get") as span:
+                values = sheet.get(cell_range)
+                span.measure(values)
+            return values
+        return self.pool.run(read)
 
-    try:
-        upload_count = int(user.get("UploadCount", 0))
-    except ValueError:
-        upload_count = 0
+    def _read_ranges(self, cell_ranges):
+        def read(sheet):
+            with trace("sheets.batch_get") as span:
+                values = sheet.batch_get(cell_ranges)
+                span.measure(values)
+            return values
+        return self.pool.run(read)
 
-    MAX_UPLOADS_PER_DAY = int(st.secrets.get("MAX_UPLOADS_PER_DAY", 10))
+    def _resolve_rows(self, rows):
+        """
+        Check [(email key, row_num)] against the emails in column A, with one
+        read for the batch. Returns the row number holding each email now,
+        None for users that are gone.
+        """
+        cells = self._read_ranges([f"A{row_num}" for _, row_num in rows])
+        resolved, rebuilt = [], False
+        for (key, row_num), cell in zip(rows, cells):
+            if cell and cell[0] and email_key(cell[0][0]) == key:
+                resolved.append(row_num)
+                continue
+            if not rebuilt:
+                self.index.invalidate()  # Rows were moved or deleted behind our back
+                rebuilt = True
+            resolved.append(self.index.lookup(key)[0])
+        return resolved
 
-    if last_upload_date == today and upload_count >= MAX_UPLOADS_PER_DAY:
-        return False, f"Daily upload limit reached ({MAX_UPLOADS_PER_DAY}/day)."
+    def _flush_saves(self, entries):
+        """SaveQueue writer: saves go to the row that holds the user's email now."""
+        row_nums = self._resolve_rows([(key, row_num) for key, row_num, _ in entries])
+        rows, missing = [], {}
+        for (key, _, values), row_num in zip(entries, row_nums):
+            if row_num is None:
+                missing[key] = "the user's row no longer exists"
+            else:
+                rows.append((row_num, values))
+        if rows:
+            self._write_rows(rows)
+        return missing
 
-    if last_upload_date != today:
-        upload_count = 1
+    def _write_rows(self, rows):
+        cells = [(row_num, _save_cells(values)) for row_num, values in rows]
+
+        def write(sheet):
+            # Fresh dicts per attempt: batch_update rewrites each "range" in place.
+            data = [{"range": f"C{row_num}:{LAST_COLUMN}{row_num}", "values": [row]} for row_num, row in cells]
+            with trace("sheets.batch_update") as span:
+                span.measure([item["values"] for item in data])
+                sheet.batch_update(data)
+        self.pool.run(write)
+
+    def read_row(self, row_num):
+        values = self._read_range(f"A{row_num}:{LAST_COLUMN}{row_num}")
+        return _row_to_record(values[0] if values else [])
+
+    def save_status(self, email):
+        """Status of the user's write-behind save ("pending", "failed", "flushed"), else None."""
+        return self.queue.status(email_key(email)) if self.queue else None
+
+    def find_user(self, email):
+        try:
+            row_num, user = self.index.lookup(email)
+        except Exception as e:
+            print(f"Error finding user: {e}")
+            return None, None
+        pending = self.queue.pending(email_key(email)) if self.queue and user else None
+        if pending:
+            # Accepted saves win over a sheet read that happened before their flush.
+            user.update(zip(SAVE_COLUMNS, pending))
+        return row_num, user
+
+    def all_users(self):
+        """Every user row from a single range read, with pending saves applied (first row per email)."""
+        users = {}
+        for row in self._read_range(f"A2:{LAST_COLUMN}"):
+            user = _row_to_record(row)
+            key = email_key(user["Email"])
+            if key and key not in users:
+                pending = self.queue.pending(key) if self.queue else None
+                if pending:
+                    user.update(zip(SAVE_COLUMNS, pending))
+                users[key] = user
+        return list(users.values())
+
+    def iter_users(self, page_size=500):
+        start = 2
+        while True:
+            # Reads stop at the first empty page; the sheet has no blank gaps that long.
+            values = self._read_range(f"A{start}:{LAST_COLUMN}{start + page_size - 1}")
+            if not values:
+                return
+            for row_num, row in enumerate(values, start=start):
+                user = _row_to_record(row)
+                if not user["Email"].strip():
+                    continue
+                pending = self.queue.pending(email_key(user["Email"])) if self.queue else None
+                if pending:
+                    user.update(zip(SAVE_COLUMNS, pending))
+                yield row_num, user
+            start += page_size
+
+    def write_rows(self, rows):
+        if self.queue is not None:
+            self.queue.flush(force=True)  # Queued saves must not land on top of the new values
+        # Row numbers may be from a read made long ago (bulk imports).
+        row_nums = self._resolve_rows([(email_key(record["Email"]), row_num) for row_num, record in rows])
+        rows = [(row_num, record) for row_num, (_, record) in zip(row_nums, rows) if row_num is not None]
+        try:
+            if rows:
+                self._write_rows([(row_num, [record[c] for c in SAVE_COLUMNS]) for row_num, record in rows])
+        except Exception:
+            self.index.invalidate()
+            raise
+        for row_num, record in rows:
+            self.index.put(row_num, record)
+        return row_nums
+
+    def insert_users(self, records):
+        # The caller checked these emails are new; a concurrent signup may still duplicate one.
+        values = [
+            [record["Email"], record["Password"]] + _save_cells([record[c] for c in SAVE_COLUMNS])
+            for record in records
+        ]
+
+        def append(sheet):
+            with trace("sheets.append_rows") as span:
+                span.measure(values)
+                return sheet.append_rows(values)
+        try:
+            first_row = _appended_row_number(self.pool.run(append, idempotent=False))
+        finally:
+            self.index.invalidate()
+        return list(range(first_row, first_row + len(records)))
+
+    def _insert_user(self, record):
+        values = [record[column] for column in COLUMNS]
+
+        def append(sheet):
+            with trace("sheets.append_row") as span:
+                span.measure(values)
+                return sheet.append_row(values)
+        try:
+            response = self.pool.run(append, idempotent=False)
+            row_num = _appended_row_number(response)
+        except Exception:
+            self.index.invalidate()
+            raise
+        self.index.put(row_num, record)
+        return row_num
+
+    def _read_for_update(self, email, row_num):
+        if self.queue is not None:
+            # The cached row already includes every accepted save. Its row
+            # number is checked against the sheet when the save is flushed.
+            _, user = self.find_user(email)
+            if not user:
+                raise ConflictError("User not found or invalid row number.")
+            return user
+        user = self.read_row(row_num)
+        if email_key(user["Email"]) != email_key(email):
+            self.index.invalidate()  # Rows were moved or deleted behind our back
+            raise ConflictError("Your account row has moved. Please try saving again.")
+        self.index.put(row_num, user)
+        return user
+
+    def _write_upload(self, email, row_num, user, values):
+        cells = _save_cells(values)  # Fails early if the config is too large
+        user.update(zip(SAVE_COLUMNS, values))
+        if self.queue is not None:
+            self.index.put(row_num, user)
+            self.queue.submit(email_key(email), row_num, values)
+            return True
+        def write(sheet):
+            with trace("sheets.update") as span:
+                span.measure(cells)
+                sheet.update(f"C{row_num}:{LAST_COLUMN}{row_num}", [cells])
+        try:
+            self.pool.run(write)
+        except Exception:
+            self.index.invalidate()  # Don't trust the cached row after a failed write
+            raise
+        self.index.put(row_num, user)
+        return False
+
+def create_store():
+    """Build the backend named by the STORAGE_BACKEND setting ("sheets" or "sqlite")."""
+    backend = str(get_setting("STORAGE_BACKEND", "sheets")).lower()
+    if backend == "sqlite":
+        store = SQLiteStore(get_setting("SQLITE_PATH", "users.db"))
+    elif backend == "sheets":
+        store = SheetsStore(write_behind=get_flag("WRITE_BEHIND_SAVES"))
     else:
-        upload_count += 1
+        raise ValueError(f"Unknown STORAGE_BACKEND: {backend}")
+    # With the SQLite backend, history lives in the users database itself.
+    store.history = create_history(get_setting("SQLITE_PATH", "users.db") if backend == "sqlite" else None)
+    store.quota = create_quota_tracker()
+    return store
 
-    now = datetime.now().isoformat()
-    config_str = json.dumps(config_json)
+@st.cache_resource
+def _configured_store():
+    return create_store()
 
-    try:
-        sheet.update(f"C{row_num}", [[now]])                     # LastUpload
-        sheet.update(f"D{row_num}", [[str(upload_count)]])       # UploadCount
-        sheet.update(f"E{row_num}", [[config_str]])              # Config
-    except Exception as e:
-        return False, f"Error updating sheet: {e}"
+_store_override = None
 
-    return True, f"✅ Upload #{upload_count} saved successfully."
+def set_store(store):
+    """Use `store` instead of the configured backend (benchmarks, admin scripts)."""
+    global _store_override
+    _store_override = store
 
+def get_store():
+    return _store_override or _configured_store()
+
+@traced("store.find_user")
+def find_user(email):
+    return get_store().find_user(email)
+
+@traced("store.register_user")
+def register_user(email, password):
+    return get_store().register_user(email, password)
+
+@traced("store.register_hashed_user")
+def register_hashed_user(email, password_hash):
+    return get_store().register_hashed_user(email, password_hash)
+
+@traced("store.authenticate_user")
+def authenticate_user(email, password):
+    return get_store().authenticate_user(email, password)
+
+@traced("store.login_user")
+def login_user(email, password):
+    return get_store().login_user(email, password)
+
+@traced("store.save_config")
+def save_config(email, config_json, base_hash=None, restore=False):
+    return get_store().save_config(email, config_json, base_hash, restore)
+
+def save_status(email):
+    return get_store().save_status(email)
+
+@traced("store.load_config")
 def load_config(email):
-    _, user = find_user(email)
-    if not user:
-        return None
-    try:
-        return json.loads(user["Config"])
-    except Exception:
-        return {}
+    return get_store().load_config(email)
+
+def config_versions(email):
+    return get_store().config_versions(email)
+
+@traced("store.load_config_version")
+def load_config_version(email, version):
+    return get_store().load_config_version(email, version)
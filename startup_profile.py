@@ -0,0 +1,86 @@
+"""
+Startup profiling, enabled with the STARTUP_PROFILE setting.
+
+`install()` at the top of the app script times every first-time import made
+from the main thread until the first script run finishes. `finish_run()`
+then prints the slowest modules with the first-run time, records them as
+metrics under the "startup" action, and keeps printing per-rerun times.
+"""
+import builtins
+import sys
+import threading
+import time
+import metrics
+from utils import get_flag
+
+# Modules printed in the startup report, slowest first.
+REPORT_LIMIT = 20
+
+_original_import = None
+_owner = None
+_stack = []
+_imports = {}
+_first_run = None
+
+
+def is_enabled():
+    return get_flag("STARTUP_PROFILE")
+
+
+def _timed_import(name, globals=None, locals=None, fromlist=(), level=0):
+    if level or name in sys.modules or threading.get_ident() != _owner:
+        return _original_import(name, globals, locals, fromlist, level)
+    start = time.perf_counter()
+    _stack.append(0.0)
+    try:
+        return _original_import(name, globals, locals, fromlist, level)
+    finally:
+        elapsed = time.perf_counter() - start
+        nested = _stack.pop()
+        if _stack:
+            _stack[-1] += elapsed
+        _imports.setdefault(name, (elapsed, elapsed - nested))
+
+
+def install():
+    """Start timing imports (once per process, only with STARTUP_PROFILE on)."""
+    global _original_import, _owner
+    if _original_import is not None or _first_run is not None or not is_enabled():
+        return
+    _owner = threading.get_ident()
+    _original_import = builtins.__import__
+    builtins.__import__ = _timed_import
+
+
+def _uninstall():
+    global _original_import
+    if _original_import is not None:
+        builtins.__import__ = _original_import
+        _original_import = None
+
+
+def import_times():
+    """[(module, seconds including its imports, seconds of its own)], slowest first."""
+    return sorted(((name, total, own) for name, (total, own) in _imports.items()), key=lambda row: -row[1])
+
+
+def finish_run(started):
+    """Report a script run that began at perf_counter() value `started`."""
+    global _first_run
+    if not is_enabled():
+        return
+    elapsed = time.perf_counter() - started
+    if _first_run is not None:
+        print(f"[startup profile] rerun took {elapsed * 1000:.1f} ms")
+        return
+    _first_run = elapsed
+    _uninstall()
+    rows = import_times()
+    print(f"[startup profile] first run took {elapsed * 1000:.1f} ms")
+    print(f"{'total ms':>10} {'self ms':>9}  module")
+    for name, total, own in rows[:REPORT_LIMIT]:
+        print(f"{total * 1000:10.1f} {own * 1000:9.1f}  {name}")
+    with metrics.action("startup"):
+        metrics.record("startup.first_run", elapsed)
+        for name, total, _ in rows:
+            metrics.record(f"import.{name}", total)
@@ -0,0 +1,255 @@
+"""
+On-disk index of BKK stops for searching and validating stop IDs.
+
+Built once from a GTFS stops.txt (or the GTFS zip) with
+
+    python stop_index.py path/to/stops.txt -o stops.idx
+
+and memory-mapped by the editor, so each process pays only for the pages
+its searches touch. The file holds the stops sorted by ID plus a sorted
+table of search keys (the stop name from each word on, the ID and the stop
+code, all lowercased and accent-stripped); both are searched with binary
+search directly on the mapping.
+
+Layout: a header, then little-endian uint32 arrays of record offsets, key
+offsets and key -> stop numbers, then the record and key bytes.
+"""
+import argparse
+import array
+import bisect
+import csv
+import io
+import mmap
+import struct
+import sys
+import unicodedata
+import zipfile
+from dataclasses import dataclass
+import streamlit as st
+from utils import get_setting
+
+MAGIC = b"BKKSTOP1"
+HEADER = struct.Struct("<8sII")
+# IDs in configs carry the agency prefix the departure API expects.
+STOP_ID_PREFIX = "BKK_"
+FIELD_SEP = "\x1f"
+# Candidates looked at per search, so a one-letter query stays fast.
+MAX_SCAN = 2000
+
+
+@dataclass(frozen=True)
+class Stop:
+    stop_id: str
+    name: str
+    code: str = ""
+
+    @property
+    def label(self) -> str:
+        return f"{self.name} ({self.stop_id})" if self.name else self.stop_id
+
+
+def normalize(text: str) -> str:
+    """Lowercase and strip accents, so "Deák" and "deak" match."""
+    decomposed = unicodedata.normalize("NFKD", text)
+    return "".join(c for c in decomposed if not unicodedata.combining(c)).casefold().strip()
+
+
+def _search_keys(stop):
+    words = normalize(stop.name).split()
+    keys = {" ".join(words[i:]) for i in range(len(words))}
+    keys.add(normalize(stop.stop_id))
+    keys.add(normalize(stop.stop_id.removeprefix(STOP_ID_PREFIX)))
+    if stop.code:
+        keys.add(normalize(stop.code))
+    keys.discard("")
+    return keys
+
+
+def read_gtfs_stops(path):
+    """Stops of a GTFS stops.txt, or of the stops.txt inside a GTFS zip."""
+    if zipfile.is_zipfile(path):
+        with zipfile.ZipFile(path) as archive:
+            text = archive.read("stops.txt").decode("utf-8-sig")
+    else:
+        with open(path, encoding="utf-8-sig") as f:
+            text = f.read()
+    stops = {}
+    for row in csv.DictReader(io.StringIO(text)):
+        stop_id = (row.get("stop_id") or "").strip()
+        if not stop_id:
+            continue
+        if not stop_id.startswith(STOP_ID_PREFIX):
+            stop_id = STOP_ID_PREFIX + stop_id
+        stops[stop_id] = Stop(stop_id, (row.get("stop_name") or "").strip(), (row.get("stop_code") or "").strip())
+    return list(stops.values())
+
+
+def _uint32_bytes(values):
+    data = array.array("I", values)
+    if sys.byteorder != "little":
+        data.byteswap()
+    return data.tobytes()
+
+
+def build_index(stops, out_path):
+    """Write the index file for `stops`; returns the number of stops."""
+    stops = sorted(stops, key=lambda s: s.stop_id)
+    records = [FIELD_SEP.join((s.stop_id, s.name, s.code, normalize(s.name))).encode("utf-8") for s in stops]
+    keys = sorted((key.encode("utf-8"), number) for number, stop in enumerate(stops) for key in _search_keys(stop))
+
+    def offsets(blobs):
+        result, position = [0], 0
+        for blob in blobs:
+            position += len(blob)
+            result.append(position)
+        return result
+
+    with open(out_path, "wb") as f:
+        f.write(HEADER.pack(MAGIC, len(records), len(keys)))
+        f.write(_uint32_bytes(offsets(records)))
+        f.write(_uint32_bytes(offsets(key for key, _ in keys)))
+        f.write(_uint32_bytes(number for _, number in keys))
+        f.write(b"".join(records))
+        f.write(b"".join(key for key, _ in keys))
+    return len(records)
+
+
+class _Strings:
+    """Read-only sequence of the byte strings in a blob, for `bisect`."""
+
+    def __init__(self, offsets, data, start):
+        self._offsets = offsets
+        self._data = data
+        self._start = start
+
+    def __len__(self):
+        return len(self._offsets) - 1
+
+    def __getitem__(self, i):
+        return self._data[self._start + self._offsets[i]:self._start + self._offsets[i + 1]]
+
+
+class _IdView:
+    """Stop IDs of the (ID-sorted) records, for `bisect`."""
+
+    def __init__(self, records):
+        self._records = records
+
+    def __len__(self):
+        return len(self._records)
+
+    def __getitem__(self, i):
+        record = self._records[i]
+        return record[:record.index(FIELD_SEP.encode())]
+
+
+class StopIndex:
+    """Memory-mapped index written by `build_index`."""
+
+    def __init__(self, path):
+        with open(path, "rb") as f:
+            self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, n_stops, n_keys = HEADER.unpack_from(self._map)
+        if magic != MAGIC:
+            raise ValueError(f"{path} is not a stop index")
+        position = HEADER.size
+        record_offsets, position = self._uint32s(position, n_stops + 1)
+        key_offsets, position = self._uint32s(position, n_keys + 1)
+        self._key_stops, position = self._uint32s(position, n_keys)
+        self._records = _Strings(record_offsets, self._map, position)
+        self._keys = _Strings(key_offsets, self._map, position + record_offsets[-1])
+        self._ids = _IdView(self._records)
+
+    def _uint32s(self, position, count):
+        end = position + 4 * count
+        view = memoryview(self._map)[position:end].cast("I")
+        if sys.byteorder != "little":
+            view = array.array("I", view)
+            view.byteswap()
+        return view, end
+
+    def __len__(self):
+        return len(self._records)
+
+    def stop(self, number):
+        return Stop(*self._fields(number)[:3])
+
+    def _fields(self, number):
+        # stop_id, name, code, normalized name
+        return self._records[number].decode("utf-8").split(FIELD_SEP)
+
+    def get(self, stop_id):
+        """The Stop with exactly this ID, or None."""
+        target = stop_id.strip().encode("utf-8")
+        number = bisect.bisect_left(self._ids, target)
+        if number < len(self) and self._ids[number] == target:
+            return self.stop(number)
+        return None
+
+    def unknown(self, stop_ids):
+        """The entries of `stop_ids` that are not stops in the index."""
+        return [stop_id for stop_id in stop_ids if self.get(stop_id) is None]
+
+    def search(self, query, limit=20):
+        """
+        Stops whose name, ID or code starts with `query`, or whose name has
+        words starting with every word of it, in any order. Case and accents
+        are ignored; exact ID matches come first.
+        """
+        words = normalize(query).split()
+        if not words:
+            return []
+        found = {}
+        exact = self.get(query)
+        if exact:
+            found[exact.stop_id] = exact
+        for number in self._prefix_range(" ".join(words)):
+            if len(found) >= limit:
+                break
+            stop = self.stop(number)
+            found.setdefault(stop.stop_id, stop)
+        if len(found) < limit and len(words) > 1:
+            # Scan by the longest word, it has the fewest candidates.
+            for number in self._prefix_range(max(words, key=len)):
+                fields = self._fields(number)
+                name_words = fields[3].split()
+                if fields[0] not in found and all(any(w.startswith(word) for w in name_words) for word in words):
+                    found[fields[0]] = Stop(*fields[:3])
+                    if len(found) >= limit:
+                        break
+        return list(found.values())
+
+    def _prefix_range(self, prefix):
+        low = prefix.encode("utf-8")
+        start = bisect.bisect_left(self._keys, low)
+        end = bisect.bisect_left(self._keys, low + b"\xff", start)  # 0xff never occurs in UTF-8
+        return (self._key_stops[i] for i in range(start, min(end, start + MAX_SCAN)))
+
+    def close(self):
+        self._map.close()
+
+
+@st.cache_resource
+def load_stop_index():
+    """The index at STOP_INDEX_PATH, shared by all sessions; None if it isn't built."""
+    path = get_setting("STOP_INDEX_PATH", "stops.idx")
+    try:
+        return StopIndex(path)
+    except FileNotFoundError:
+        return None
+    except (OSError, ValueError) as e:
+        print(f"Could not load stop index {path}: {e}")
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build the stop search index from GTFS stops.")
+    parser.add_argument("stops", help="GTFS stops.txt or GTFS zip")
+    parser.add_argument("-o", "--output", default=get_setting("STOP_INDEX_PATH", "stops.idx"))
+    args = parser.parse_args()
+    count = build_index(read_gtfs_stops(args.stops), args.output)
+    print(f"Indexed {count} stops into {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,386 @@
+import hashlib
+import sqlite3
+import threading
+from datetime import datetime, date
+from config_codec import encode_config, decode_config
+from config_model import Config, validate_config, changed_sections
+from utils import get_setting, config_hash
+
+# Fields of a user record, in worksheet column order.
+COLUMNS = ["Email", "Password", "LastUpload", "UploadCount", "Config"]
+# Fields written by a config save.
+SAVE_COLUMNS = ["LastUpload", "UploadCount", "Config"]
+
+CONFLICT_MESSAGE = "Config was changed in another session. Reload it before saving."
+
+
+class ConflictError(Exception):
+    """The stored user row changed between reading and writing a save."""
+
+
+def hash_password(password):
+    return hashlib.sha256(password.encode()).hexdigest()
+
+
+def email_key(email):
+    return email.strip().lower()
+
+
+def stored_model(user):
+    """Validated Config of a user record; defaults if the stored value is unreadable."""
+    try:
+        data = decode_config(user["Config"])
+    except Exception as e:
+        print(f"Unreadable config for {user.get('Email')}, using defaults: {e}")
+        return Config()
+    return validate_config(data)[0]
+
+
+def parse_config(user):
+    return stored_model(user).to_dict()
+
+
+def next_upload(user, config_json, base_hash=None, counted=True):
+    """
+    Check a save against the current user row.
+    Returns (error, values) where `values` are the new SAVE_COLUMNS.
+    With `counted` off the upload counters are kept as they are.
+    """
+    if base_hash is not None and config_hash(parse_config(user)) != base_hash:
+        return CONFLICT_MESSAGE, None
+
+    if not counted:
+        return None, [user.get("LastUpload", ""), user.get("UploadCount", "0"), encode_config(config_json)]
+
+    now = datetime.now().isoformat()
+    today = date.today().isoformat()
+    last_upload_raw = user.get("LastUpload", "")
+    last_upload_date = last_upload_raw.split("T")[0] if "T" in last_upload_raw else ""
+
+    try:
+        upload_count = int(user.get("UploadCount", 0))
+    except ValueError:
+        upload_count = 0
+
+    MAX_UPLOADS_PER_DAY = int(get_setting("MAX_UPLOADS_PER_DAY", 10))
+
+    if last_upload_date == today and upload_count >= MAX_UPLOADS_PER_DAY:
+        return f"Daily upload limit reached ({MAX_UPLOADS_PER_DAY}/day).", None
+
+    if last_upload_date != today:
+        upload_count = 1
+    else:
+        upload_count += 1
+
+    return None, [now, str(upload_count), encode_config(config_json)]
+
+
+class UserStore:
+    """
+    Storage interface for users and their configs.
+
+    Backends implement `find_user` and the three underscore primitives; the
+    account and quota rules are shared here. Records are dicts keyed by
+    COLUMNS with string values, whatever the backend.
+    """
+
+    def __init__(self):
+        self._row_locks = {}
+        self._row_locks_guard = threading.Lock()
+        self.history = None  # Optional ConfigHistory recording every accepted save
+        self.quota = None  # Optional QuotaTracker rejecting users known to be over quota early
+        # Called as listener(email, config, stored Config value) after every accepted save
+        self.save_listeners = []
+
+    def find_user(self, email):
+        """Return (row_id, record), or (None, None) if the email is unknown."""
+        raise NotImplementedError
+
+    def _insert_user(self, record):
+        """Store a new user; return its row id, or None if the email exists."""
+        raise NotImplementedError
+
+    def _read_for_update(self, email, row_id):
+        """Authoritative copy of the row a save is checked against."""
+        raise NotImplementedError
+
+    def _write_upload(self, email, row_id, user, values):
+        """Persist SAVE_COLUMNS values; return True if the write was deferred."""
+        raise NotImplementedError
+
+    def iter_users(self, page_size=500):
+        """Yield (row_id, record) for every user, reading `page_size` rows at a time."""
+        raise NotImplementedError
+
+    def write_rows(self, rows):
+        """
+        Overwrite the SAVE_COLUMNS of existing users: [(row_id, record)], one batch.
+        Rows are matched by the record's email; returns the row ids written,
+        None where the user no longer exists.
+        """
+        raise NotImplementedError
+
+    def insert_users(self, records):
+        """Store new users in one batch; return their row ids (None where the email exists)."""
+        raise NotImplementedError
+
+    def all_users(self):
+        """Every user record, read from the backend in bulk."""
+        return [record for _, record in self.iter_users()]
+
+    def save_status(self, email):
+        return None
+
+    def register_user(self, email, password):
+        return self.register_hashed_user(email, hash_password(password))
+
+    def register_hashed_user(self, email, password_hash):
+        row_id, existing = self.find_user(email)
+        if existing:
+            return None, "exists"  # User exists
+        now = datetime.now().isoformat()
+        record = dict(zip(COLUMNS, [email, password_hash, now, "0", "{}"]))
+        row_id = self._insert_user(record)
+        if row_id is None:
+            return None, "exists"
+        return row_id, dict(record)  # Return newly created user info
+
+    def authenticate_user(self, email, password):
+        """
+        Verify credentials with a single user lookup.
+        Returns (ok, message, row_id, user, config); `user` is None when the
+        email is not registered, `config` is only parsed on success.
+        """
+        row_id, user = self.find_user(email)
+        if not user:
+            return False, "User not found.", None, None, None
+        if hash_password(password) != user["Password"]:
+            return False, "Incorrect password.", row_id, user, None
+        return True, "Login successful.", row_id, user, parse_config(user)
+
+    def login_user(self, email, password):
+        ok, msg, row_id, _, _ = self.authenticate_user(email, password)
+        return ok, msg, row_id if ok else None
+
+    def save_config(self, email, config_json, base_hash=None, restore=False):
+        """
+        Save a config, enforcing MAX_UPLOADS_PER_DAY.
+
+        When `base_hash` (the config_hash the editor started from) is given
+        and the stored config no longer matches it, the save is rejected
+        instead of overwriting a change made in another session.
+
+        The config is validated and normalized first; saving a config that
+        equals the stored one succeeds without touching the backend.
+
+        A `restore` (rolling back to a version from the history) is not an
+        upload: it neither counts against nor is refused by the daily quota.
+        """
+        model, problems = validate_config(config_json)
+        if problems:
+            return False, "Invalid config: " + "; ".join(problems[:3])
+
+        error = self.quota.check(email) if self.quota is not None and not restore else None
+        if error:
+            return False, error  # Known to be over quota: no backend call at all
+
+        row_id, user = self.find_user(email)
+
+        if not user or not row_id:
+            return False, "User not found or invalid row number."
+
+        current = stored_model(user)
+        if current == model:
+            return True, "No changes to save."
+        print(f"Saving config for {email}, changed: {', '.join(changed_sections(current, model))}")
+        config_json = model.to_dict()
+
+        # Serializes check-and-write for saves of the same user in this process.
+        with self._row_lock(email):
+            try:
+                user = self._read_for_update(email, row_id)
+            except ConflictError as e:
+                return False, str(e)
+            except Exception as e:
+                return False, f"Error reading stored config: {e}"
+
+            if self.quota is not None:
+                self.quota.observe(email, user)
+            error, values = next_upload(user, config_json, base_hash, counted=not restore)
+            if error:
+                return False, error
+
+            try:
+                deferred = self._write_upload(email, row_id, user, values)
+            except Exception as e:
+                if isinstance(e, ConflictError):
+                    return False, str(e)
+                return False, f"Error saving config: {e}"
+            if self.quota is not None:
+                self.quota.observe(email, dict(zip(SAVE_COLUMNS, values)))
+
+            if self.history is not None:
+                try:
+                    self.history.record(email, config_json, previous=current.to_dict())
+                except Exception as e:
+                    print(f"Failed to record config history for {email}: {e}")
+
+            for listener in self.save_listeners:
+                try:
+                    listener(email, config_json, values[2])
+                except Exception as e:
+                    print(f"Save listener failed for {email}: {e}")
+
+        if restore:
+            return True, "✅ Config restored, saving in the background." if deferred else "✅ Config restored."
+        upload_count = values[1]
+        if deferred:
+            return True, f"✅ Upload #{upload_count} accepted, saving in the background."
+        return True, f"✅ Upload #{upload_count} saved successfully."
+
+    def load_config(self, email):
+        _, user = self.find_user(email)
+        if not user:
+            return None
+        return parse_config(user)
+
+    def config_versions(self, email):
+        return self.history.versions(email) if self.history else []
+
+    def load_config_version(self, email, version):
+        config = self.history.config_at(email, version) if self.history else None
+        return None if config is None else validate_config(config)[0].to_dict()
+
+    def _row_lock(self, email):
+        with self._row_locks_guard:
+            return self._row_locks.setdefault(email_key(email), threading.Lock())
+
+
+class SQLiteStore(UserStore):
+    """
+    Users in a local SQLite database (WAL mode).
+
+    Emails live in a UNIQUE COLLATE NOCASE column, so lookups and duplicate
+    checks use its index. Saves are a compare-and-swap on the previous row
+    values, which also protects against writers in other processes.
+    """
+
+    def __init__(self, path="users.db"):
+        super().__init__()
+        self._path = path
+        self._local = threading.local()
+        conn = self._conn()
+        conn.execute("PRAGMA journal_mode=WAL")
+        with conn:
+            conn.execute(
+                """CREATE TABLE IF NOT EXISTS users (
+                    id INTEGER PRIMARY KEY,
+                    email TEXT NOT NULL UNIQUE COLLATE NOCASE,
+                    password TEXT NOT NULL,
+                    last_upload TEXT NOT NULL DEFAULT '',
+                    upload_count INTEGER NOT NULL DEFAULT 0,
+                    config TEXT NOT NULL DEFAULT '{}'
+                )"""
+            )
+
+    def _conn(self):
+        # sqlite3 connections must not be shared between threads.
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self._path, timeout=30)
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    @staticmethod
+    def _record(row):
+        return {
+            "Email": row["email"],
+            "Password": row["password"],
+            "LastUpload": row["last_upload"],
+            "UploadCount": str(row["upload_count"]),
+            "Config": row["config"],
+        }
+
+    def find_user(self, email):
+        try:
+            row = self._conn().execute("SELECT * FROM users WHERE email = ?", (email.strip(),)).fetchone()
+        except Exception as e:
+            print(f"Error finding user: {e}")
+            return None, None
+        if row is None:
+            return None, None
+        return row["id"], self._record(row)
+
+    def iter_users(self, page_size=500):
+        last_id = 0
+        while True:
+            rows = self._conn().execute(
+                "SELECT * FROM users WHERE id > ? ORDER BY id LIMIT ?", (last_id, page_size)
+            ).fetchall()
+            for row in rows:
+                yield row["id"], self._record(row)
+            if len(rows) < page_size:
+                return
+            last_id = rows[-1]["id"]
+
+    def write_rows(self, rows):
+        conn = self._conn()
+        row_ids = []
+        with conn:
+            for row_id, record in rows:
+                cursor = conn.execute(
+                    "UPDATE users SET last_upload = ?, upload_count = ?, config = ? WHERE id = ? AND email = ?",
+                    (record["LastUpload"], int(record["UploadCount"] or 0), record["Config"], row_id,
+                     record["Email"].strip()),
+                )
+                row_ids.append(row_id if cursor.rowcount else None)
+        return row_ids
+
+    def insert_users(self, records):
+        conn = self._conn()
+        row_ids = []
+        with conn:
+            for record in records:
+                cursor = conn.execute(
+                    """INSERT OR IGNORE INTO users (email, password, last_upload, upload_count, config)
+                       VALUES (?, ?, ?, ?, ?)""",
+                    (record["Email"].strip(), record["Password"], record["LastUpload"],
+                     int(record["UploadCount"] or 0), record["Config"]),
+                )
+                row_ids.append(cursor.lastrowid if cursor.rowcount else None)
+        return row_ids
+
+    def _insert_user(self, record):
+        conn = self._conn()
+        try:
+            with conn:
+                cursor = conn.execute(
+                    "INSERT INTO users (email, password, last_upload, upload_count, config) VALUES (?, ?, ?, ?, ?)",
+                    (record["Email"].strip(), record["Password"], record["LastUpload"],
+                     int(record["UploadCount"]), record["Config"]),
+                )
+        except sqlite3.IntegrityError:
+            return None
+        return cursor.lastrowid
+
+    def _read_for_update(self, email, row_id):
+        row = self._conn().execute("SELECT * FROM users WHERE id = ?", (row_id,)).fetchone()
+        if row is None or email_key(row["email"]) != email_key(email):
+            raise ConflictError("Your account could not be found. Please log in again.")
+        return self._record(row)
+
+    def _write_upload(self, email, row_id, user, values):
+        last_upload, upload_count, config_str = values
+        conn = self._conn()
+        with conn:
+            cursor = conn.execute(
+                """UPDATE users SET last_upload = ?, upload_count = ?, config = ?
+                   WHERE id = ? AND last_upload = ? AND upload_count = ? AND config = ?""",
+                (last_upload, int(upload_count), config_str,
+                 row_id, user["LastUpload"], int(user["UploadCount"] or 0), user["Config"]),
+            )
+        if cursor.rowcount == 0:
+            raise ConflictError(CONFLICT_MESSAGE)
+        return False
@@ -0,0 +1,54 @@
+import json
+
+import pytest
+
+pytest.importorskip("streamlit")
+
+import bulk_io
+from storage import SQLiteStore
+
+
+def test_import_skips_entries_with_non_finite_numbers(tmp_path):
+    store = SQLiteStore(str(tmp_path / "users.db"))
+    store.register_user("a@example.com", "pw")
+    store.register_user("b@example.com", "pw")
+    before = store.load_config("a@example.com")
+    path = tmp_path / "backup.jsonl"
+    path.write_text(
+        '{"email": "a@example.com", "config": {"refresh_interval_seconds": NaN}}\n'
+        + json.dumps({"email": "b@example.com", "config": {"custom_title": "B"}}) + "\n",
+        encoding="utf-8",
+    )
+    report = bulk_io.import_configs(store, str(path))
+    assert (report.updated, report.error_count) == (1, 1)
+    assert "expected a whole number" in report.errors[0]
+    assert store.load_config("b@example.com")["custom_title"] == "B"
+    assert store.load_config("a@example.com") == before
+
+
+def test_import_follows_rows_moved_since_it_started(tmp_path, monkeypatch):
+    pytest.importorskip("gspread")
+    import sheet_manager
+    from benchmarks.fakes import FakeWorksheet
+    from storage import COLUMNS
+
+    sheet = FakeWorksheet([COLUMNS] + [[f"{name}@example.com", "hash", "", "0", "{}"] for name in "abc"])
+    store = sheet_manager.SheetsStore(factory=lambda: sheet)
+    iter_users = store.iter_users
+
+    def iter_then_delete_a(page_size=500):
+        yield from iter_users(page_size)
+        del sheet.rows[1]  # a's row goes away after the import read the row numbers
+
+    monkeypatch.setattr(store, "iter_users", iter_then_delete_a)
+    path = tmp_path / "backup.jsonl"
+    path.write_text("".join(
+        json.dumps({"email": f"{name}@example.com", "config": {"custom_title": name}}) + "\n" for name in "abc"
+    ), encoding="utf-8")
+    report = bulk_io.import_configs(store, str(path))
+    assert (report.updated, report.error_count) == (2, 1)
+    assert "a@example.com: user was deleted" in report.errors[0]
+    assert [row[0] for row in sheet.rows[1:]] == ["b@example.com", "c@example.com"]
+    assert store.load_config("b@example.com")["custom_title"] == "b"
+    assert store.load_config("c@example.com")["custom_title"] == "c"
+    store.pool.close()
@@ -0,0 +1,91 @@
+"""
+Backend calls per login, registration and save flow, counted on a FakeWorksheet.
+
+    python -m pytest tests
+"""
+import json
+import os
+
+import pytest
+
+pytest.importorskip("streamlit")
+pytest.importorskip("gspread")
+
+import sheet_manager
+from benchmarks.fakes import FakeWorksheet
+from quota import QuotaTracker
+from storage import COLUMNS, hash_password
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+@pytest.fixture
+def sheet():
+    return FakeWorksheet([COLUMNS, ["user@example.com", hash_password("secret"), "", "0", "{}"]])
+
+
+@pytest.fixture
+def store(sheet):
+    store = sheet_manager.SheetsStore(factory=lambda: sheet)
+    yield store
+    store.pool.close()
+
+
+@pytest.fixture
+def template():
+    with open(os.path.join(ROOT, "config_template.json"), encoding="utf-8") as f:
+        return json.load(f)
+
+
+def test_login_is_one_read(store, sheet):
+    ok, _, row_num, user, config = store.authenticate_user("user@example.com", "secret")
+    assert ok and row_num == 2 and user["Email"] == "user@example.com" and config is not None
+    assert sheet.calls == {"get": 1}
+
+
+def test_login_with_warm_index_makes_no_calls(store, sheet):
+    store.authenticate_user("user@example.com", "secret")
+    sheet.calls.clear()
+    ok, *_ = store.authenticate_user("user@example.com", "secret")
+    assert ok
+    assert sheet.calls == {}
+
+
+def test_registration_is_one_read_and_one_append(store, sheet):
+    row_num, record = store.register_user("new@example.com", "secret")
+    assert row_num == 3 and record["Email"] == "new@example.com"
+    assert sheet.calls == {"get": 1, "append_row": 1}
+
+
+def test_registered_user_logs_in_without_a_read(store, sheet):
+    store.register_user("new@example.com", "secret")
+    sheet.calls.clear()
+    ok, *_ = store.authenticate_user("new@example.com", "secret")
+    assert ok
+    assert sheet.calls == {}
+
+
+def test_save_reads_the_row_once_and_writes_once(store, sheet, template):
+    store.authenticate_user("user@example.com", "secret")
+    sheet.calls.clear()
+    ok, message = store.save_config("user@example.com", template)
+    assert ok, message
+    assert sheet.calls == {"get": 1, "update": 1}
+
+
+def test_unchanged_save_makes_no_calls(store, sheet, template):
+    store.save_config("user@example.com", template)
+    sheet.calls.clear()
+    ok, message = store.save_config("user@example.com", template)
+    assert ok and message == "No changes to save."
+    assert sheet.calls == {}
+
+
+def test_save_over_quota_makes_no_calls_with_a_tracker(store, sheet, template, monkeypatch):
+    monkeypatch.setenv("MAX_UPLOADS_PER_DAY", "1")
+    store.quota = QuotaTracker(1)
+    assert store.save_config("user@example.com", template)[0]
+    sheet.calls.clear()
+    ok, message = store.save_config("user@example.com", dict(template, custom_title="Again"))
+    assert not ok and message == store.quota.message
+    assert sheet.calls == {}
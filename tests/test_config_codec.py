@@ -0,0 +1,65 @@
+import json
+
+import pytest
+
+from config_codec import COMPRESSED_PREFIX, decode_config, encode_config, split_cells
+
+CONFIG = {"custom_title": "Deák Ferenc tér", "layout": {"stop_order": [f"F{i:05d}" for i in range(200)]}}
+
+
+def test_legacy_plain_json_rows_still_decode():
+    legacy = json.dumps(CONFIG, indent=2, ensure_ascii=False)
+    assert decode_config(legacy) == CONFIG
+    assert decode_config("{}") == {}
+
+
+def test_large_configs_are_compressed_and_round_trip():
+    stored = encode_config(CONFIG)
+    assert stored.startswith(COMPRESSED_PREFIX)
+    assert len(stored) < len(json.dumps(CONFIG, separators=(",", ":"), ensure_ascii=False))
+    assert decode_config(stored) == CONFIG
+
+
+def test_tiny_configs_stay_plain_json():
+    assert encode_config({}) == "{}"
+    assert decode_config(encode_config({"a": 1})) == {"a": 1}
+
+
+def test_corrupt_compressed_config_raises_value_error():
+    with pytest.raises(ValueError):
+        decode_config(COMPRESSED_PREFIX + "not base64!")
+
+
+def test_split_cells_pads_and_joins_back():
+    cells = split_cells("abcdefghij", 4, 4)
+    assert cells == ["abcd", "efgh", "ij", ""]
+    assert "".join(cells) == "abcdefghij"
+    assert split_cells("", 4, 3) == ["", "", ""]
+    assert split_cells("abcd", 4, 2) == ["abcd", ""]
+
+
+def test_split_cells_rejects_configs_over_the_cell_budget():
+    with pytest.raises(ValueError, match="too large"):
+        split_cells("x" * 13, 4, 3)
+
+
+def test_sheets_row_spills_into_overflow_cells_and_reads_back(monkeypatch):
+    pytest.importorskip("streamlit")
+    pytest.importorskip("gspread")
+    import sheet_manager
+    from benchmarks.fakes import FakeWorksheet
+    from storage import COLUMNS
+
+    monkeypatch.setattr(sheet_manager, "CELL_CHAR_LIMIT", 400)
+    sheet = FakeWorksheet([COLUMNS, ["user@example.com", "hash", "", "0", "{}"]])
+    config = {"custom_title": "x" * 20, "layout": {"stop_order": [f"F{i:05d}" for i in range(100)]}}
+    store = sheet_manager.SheetsStore(factory=lambda: sheet)
+    assert store.save_config("user@example.com", config)[0]
+    store.pool.close()
+
+    row = sheet.rows[1]
+    assert len(row) == 8 and all(len(cell) <= 400 for cell in row[4:]) and row[6]
+    fresh = sheet_manager.SheetsStore(factory=lambda: sheet)
+    saved = fresh.load_config("user@example.com")
+    assert saved["layout"]["stop_order"] == config["layout"]["stop_order"]
+    fresh.pool.close()
@@ -0,0 +1,87 @@
+import pytest
+
+pytest.importorskip("streamlit")
+
+import config_history
+from config_history import ConfigHistory, apply_delta, create_history, diff_configs
+
+
+STYLE = {"colors": {f"color{i}": "#000000" for i in range(20)}}
+
+
+def config(n):
+    # Mostly unchanged between versions, so deltas are smaller than the config.
+    return {"custom_title": f"v{n}", "layout": {"columns_per_row": n % 5 + 1, "stop_order": ["F1", "F2"][: n % 3]},
+            "style": STYLE}
+
+
+@pytest.fixture
+def history(tmp_path):
+    return ConfigHistory(str(tmp_path / "history.db"), snapshot_every=3, max_versions=50)
+
+
+def test_diff_and_apply_round_trip():
+    old = {"a": 1, "b": {"c": 2, "d": 3}, "e": [1]}
+    new = {"a": 1, "b": {"c": 4}, "e": [1, 2], "f": "new"}
+    delta = diff_configs(old, new)
+    assert sorted(map(tuple, delta["unset"])) == [("b", "d")]
+    assert apply_delta(old, delta) == new
+    assert old["b"] == {"c": 2, "d": 3}  # Not modified in place
+
+
+def test_versions_rebuild_across_snapshots(history):
+    for n in range(1, 8):
+        assert history.record("user@example.com", config(n)) == n
+    versions = history.versions("USER@example.com")
+    assert [v.version for v in versions] == [7, 6, 5, 4, 3, 2, 1]
+    assert [v.snapshot for v in reversed(versions)] == [True, False, False, True, False, False, True]
+    for n in range(1, 8):
+        assert history.config_at("user@example.com", n) == config(n)
+
+
+def test_unchanged_config_is_not_a_new_version(history):
+    history.record("user@example.com", config(1))
+    assert history.record("user@example.com", config(1)) is None
+    assert len(history.versions("user@example.com")) == 1
+
+
+def test_first_record_keeps_the_replaced_config(history):
+    assert history.record("user@example.com", config(2), previous=config(1)) == 2
+    assert history.config_at("user@example.com", 1) == config(1)
+    assert history.config_at("user@example.com", 2) == config(2)
+
+
+def test_compaction_keeps_the_newest_versions_rebuildable(tmp_path):
+    history = ConfigHistory(str(tmp_path / "history.db"), snapshot_every=10, max_versions=4)
+    for n in range(1, 10):
+        history.record("user@example.com", config(n))
+    versions = history.versions("user@example.com")
+    assert [v.version for v in versions] == [9, 8, 7, 6]
+    assert versions[-1].snapshot  # Was a delta, rewritten before its base was dropped
+    assert history.config_at("user@example.com", 5) is None
+    for n in range(6, 10):
+        assert history.config_at("user@example.com", n) == config(n)
+
+
+def test_old_versions_expire_but_the_newest_stays(tmp_path, monkeypatch):
+    now = [1_000_000.0]
+    monkeypatch.setattr(config_history.time, "time", lambda: now[0])
+    history = ConfigHistory(str(tmp_path / "history.db"), max_age_days=1)
+    history.record("user@example.com", config(1))
+    history.record("user@example.com", config(2))
+    now[0] += 2 * 86400
+    history.record("user@example.com", config(3))
+    assert [v.version for v in history.versions("user@example.com")] == [3]
+    now[0] += 2 * 86400
+    assert history.record("user@example.com", config(4)) == 4
+    assert [v.version for v in history.versions("user@example.com")] == [4]
+    assert history.config_at("user@example.com", 4) == config(4)
+
+
+def test_history_needs_a_path(tmp_path, monkeypatch):
+    monkeypatch.delenv("HISTORY_DB_PATH", raising=False)
+    assert create_history() is None
+    assert isinstance(create_history(str(tmp_path / "users.db")), ConfigHistory)
+    monkeypatch.setenv("HISTORY_DB_PATH", str(tmp_path / "history.db"))
+    monkeypatch.setenv("HISTORY_ENABLED", "false")
+    assert create_history() is None
@@ -0,0 +1,31 @@
+import json
+
+import pytest
+
+from config_model import validate_config
+
+
+@pytest.mark.parametrize("raw", ["NaN", "Infinity", "-Infinity", "1e400", "7.9", '"7.5"', '"many"'])
+def test_bad_numbers_are_problems_not_errors(raw):
+    model, problems = validate_config(json.loads('{"refresh_interval_seconds": %s}' % raw))
+    assert model.refresh_interval_seconds == 30
+    assert problems and problems[0].startswith("refresh_interval_seconds: expected a")
+
+
+@pytest.mark.parametrize("raw, value", [("45", 45), ("45.0", 45), ('" 45 "', 45)])
+def test_whole_numbers_are_accepted(raw, value):
+    model, problems = validate_config(json.loads('{"refresh_interval_seconds": %s}' % raw))
+    assert model.refresh_interval_seconds == value
+    assert problems == []
+
+
+def test_out_of_range_numbers_are_clamped():
+    model, problems = validate_config({"layout": {"columns_per_row": 9}})
+    assert model.layout.columns_per_row == 5
+    assert problems == ["layout.columns_per_row: must be between 1 and 5"]
+
+
+def test_booleans_are_not_numbers():
+    model, problems = validate_config({"refresh_interval_seconds": True})
+    assert model.refresh_interval_seconds == 30
+    assert problems == ["refresh_interval_seconds: expected a number"]
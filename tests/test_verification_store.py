@@ -0,0 +1,80 @@
+import pytest
+
+pytest.importorskip("streamlit")
+
+import verification_store
+from verification_store import (
+    CODE_TTL_SECONDS, MAX_ATTEMPTS, PENDING_TTL_SECONDS, MemoryVerificationStore, SQLiteVerificationStore,
+)
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1_000_000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(verification_store.time, "time", clock)
+    return clock
+
+
+@pytest.fixture(params=["memory", "sqlite"])
+def store(request, tmp_path):
+    if request.param == "memory":
+        return MemoryVerificationStore()
+    return SQLiteVerificationStore(str(tmp_path / "verification.db"))
+
+
+def test_correct_code_is_accepted_once(store, clock):
+    token = store.create("user@example.com", "hash", "123456")
+    result, entry = store.check_code(token, "123456")
+    assert result == "ok" and entry.email == "user@example.com"
+    assert store.check_code(token, "123456")[0] == "missing"
+
+
+def test_wrong_codes_lock_the_entry(store, clock):
+    token = store.create("user@example.com", "hash", "123456")
+    for attempt in range(1, MAX_ATTEMPTS + 1):
+        result, entry = store.check_code(token, "000000")
+        assert result == "invalid" and entry.attempts_left == MAX_ATTEMPTS - attempt
+    assert store.check_code(token, "123456")[0] == "locked"
+
+
+def test_code_expires_before_the_registration(store, clock):
+    token = store.create("user@example.com", "hash", "123456")
+    clock.now += CODE_TTL_SECONDS + 1
+    assert store.check_code(token, "123456")[0] == "expired"
+    clock.now += PENDING_TTL_SECONDS
+    assert store.get(token) is None
+    assert store.check_code(token, "123456")[0] == "missing"
+
+
+def test_reissue_resets_attempts_and_expiry(store, clock):
+    token = store.create("user@example.com", "hash", "123456")
+    for _ in range(MAX_ATTEMPTS):
+        store.check_code(token, "000000")
+    clock.now += CODE_TTL_SECONDS + 1
+    assert store.reissue(token, "654321")
+    assert store.get(token).attempts == 0
+    assert store.check_code(token, "123456")[0] == "invalid"  # The old code is gone
+    assert store.check_code(token, "654321")[0] == "ok"
+
+
+def test_reissue_of_an_expired_registration_fails(store, clock):
+    token = store.create("user@example.com", "hash", "123456")
+    clock.now += PENDING_TTL_SECONDS + 1
+    assert not store.reissue(token, "654321")
+
+
+def test_memory_store_caps_its_size(clock):
+    store = MemoryVerificationStore(max_entries=3)
+    tokens = []
+    for i in range(5):
+        clock.now += 1
+        tokens.append(store.create(f"user{i}@example.com", "hash", "123456"))
+    assert [store.get(token) is not None for token in tokens] == [False, False, True, True, True]
@@ -0,0 +1,76 @@
+"""Write-behind saves (WRITE_BEHIND_SAVES) on a FakeWorksheet whose rows move."""
+import json
+import os
+
+import pytest
+
+pytest.importorskip("streamlit")
+pytest.importorskip("gspread")
+
+import sheet_manager
+from benchmarks.fakes import FakeWorksheet
+from storage import COLUMNS, hash_password
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+@pytest.fixture
+def sheet():
+    return FakeWorksheet([COLUMNS] + [[f"{name}@example.com", hash_password("pw"), "", "0", "{}"] for name in "abc"])
+
+
+@pytest.fixture
+def store(sheet, monkeypatch):
+    monkeypatch.setenv("WRITE_BEHIND_INTERVAL_SECONDS", "3600")  # Tests flush by hand
+    store = sheet_manager.SheetsStore(factory=lambda: sheet, write_behind=True)
+    store.find_user("a@example.com")  # Build the index before rows move
+    yield store
+    store.pool.close()
+
+
+@pytest.fixture
+def template():
+    with open(os.path.join(ROOT, "config_template.json"), encoding="utf-8") as f:
+        return json.load(f)
+
+
+def test_save_follows_a_moved_row(store, sheet, template):
+    del sheet.rows[1]  # a's row is deleted, b and c move up
+    assert store.save_config("b@example.com", dict(template, custom_title="B"))[0]
+    store.queue.flush()
+    assert sheet.rows[1][0] == "b@example.com" and sheet.rows[1][4] != "{}"
+    assert sheet.rows[2][0] == "c@example.com" and sheet.rows[2][4] == "{}"
+    assert store.save_status("b@example.com") == "flushed"
+
+
+def test_save_of_a_deleted_user_is_dropped(store, sheet, template):
+    assert store.save_config("c@example.com", dict(template, custom_title="C"))[0]
+    del sheet.rows[3]
+    store.queue.flush()
+    assert [row[4] for row in sheet.rows[1:]] == ["{}", "{}"]
+    assert store.save_status("c@example.com") == "dropped"
+
+
+def test_failing_row_does_not_block_the_batch(store, sheet, template, monkeypatch):
+    write_rows = store._write_rows
+
+    def fail_row_3(rows):
+        if any(row_num == 3 for row_num, _ in rows):
+            raise RuntimeError("bad row")
+        write_rows(rows)
+
+    monkeypatch.setattr(store, "_write_rows", fail_row_3)
+    for name in "abc":
+        assert store.save_config(f"{name}@example.com", dict(template, custom_title=name))[0]
+    store.queue.flush()
+    assert store.save_status("a@example.com") == "flushed"
+    assert store.save_status("b@example.com") == "failed"
+    assert store.save_status("c@example.com") == "flushed"
+
+    calls = sum(sheet.calls.values())
+    store.queue.flush()  # b is backing off
+    assert sum(sheet.calls.values()) == calls
+
+    monkeypatch.setattr(store, "_write_rows", write_rows)
+    store.queue.flush(force=True)
+    assert store.save_status("b@example.com") == "flushed"
@@ -0,0 +1,97 @@
+import hashlib
+import os
+import tempfile
+import streamlit as st
+import metrics
+from sheet_manager import get_store
+from utils import get_setting
+
+
+def admin_emails():
+    value = get_setting("ADMIN_EMAILS", "")
+    if isinstance(value, str):
+        value = value.split(",")
+    return {email.strip().lower() for email in value if email.strip()}
+
+
+def is_admin(email: str) -> bool:
+    return bool(email) and email.strip().lower() in admin_emails()
+
+
+def metrics_section():
+    st.subheader("📊 Backend Metrics")
+    enabled = st.toggle("Collect metrics", metrics.is_enabled(), key="metrics_enabled")
+    if enabled != metrics.is_enabled():
+        metrics.set_enabled(enabled)
+
+    rows = metrics.snapshot()
+    if rows:
+        st.dataframe(rows, use_container_width=True, hide_index=True)
+    else:
+        st.info("No backend calls recorded yet.")
+
+    col1, col2 = st.columns(2)
+    col1.download_button("⬇️ Prometheus metrics", metrics.render_prometheus(), file_name="metrics.prom", mime="text/plain")
+    if col2.button("Reset metrics"):
+        metrics.reset()
+        st.rerun()
+
+
+def backup_section():
+    from bulk_io import export_jsonl, export_zip, import_configs
+    st.subheader("💾 Backup & Restore")
+    export_format = st.radio("Export format", ["JSONL (with accounts)", "ZIP of config.json files"], horizontal=True)
+    if st.button("Prepare export"):
+        jsonl = export_format.startswith("JSONL")
+        file_name, mime = ("configs.jsonl", "application/jsonl") if jsonl else ("configs.zip", "application/zip")
+        # Exported to a temp file, so building it does not hold every user in memory.
+        fd, path = tempfile.mkstemp(prefix="bkk-export-", suffix=os.path.splitext(file_name)[1])
+        try:
+            with metrics.action("export"), st.spinner("Exporting users…"):
+                if jsonl:
+                    with os.fdopen(fd, "w", encoding="utf-8") as out:
+                        count = export_jsonl(get_store(), out)
+                else:
+                    with os.fdopen(fd, "wb") as out:
+                        count = export_zip(get_store(), out)
+            st.success(f"Exported {count} users.")
+            size_mb = os.path.getsize(path) / 1e6
+            if size_mb > float(get_setting("EXPORT_DOWNLOAD_MAX_MB", 100)):
+                # The browser download is served from memory; large stores go through the CLI.
+                st.warning(f"The export is {size_mb:.0f} MB, too large to download here. "
+                           f"Run `python bulk_io.py export {file_name}` on the server instead.")
+            else:
+                with open(path, "rb") as f:
+                    st.download_button(f"⬇️ {file_name}", f, file_name=file_name, mime=mime)
+        finally:
+            os.remove(path)
+
+    upload = st.file_uploader("Import a JSONL export or config ZIP", type=["jsonl", "zip"])
+    if upload is not None and st.button("Import"):
+        data = upload.getvalue()
+        # Named by content, so importing the same file again resumes from its checkpoint.
+        path = os.path.join(tempfile.gettempdir(), f"bkk-import-{hashlib.sha256(data).hexdigest()[:16]}-{os.path.basename(upload.name)}")
+        with open(path, "wb") as f:
+            f.write(data)
+        bar = st.progress(0.0, text="Importing…")
+        with metrics.action("import"):
+            try:
+                report = import_configs(get_store(), path, progress=lambda done, total: bar.progress(done / max(total, 1)))
+            except Exception as e:
+                st.error(f"Import stopped: {e}. Import the same file again to resume.")
+                return
+        os.remove(path)
+        if report.resumed_from:
+            st.info(f"Resumed after entry {report.resumed_from}.")
+        st.success(f"Updated {report.updated} and created {report.created} users.")
+        if report.errors:
+            st.warning(f"{report.error_count} entries were skipped:\n\n" + "\n".join(f"- {e}" for e in report.errors))
+
+
+def show_admin_panel():
+    st.title("🧰 Admin")
+    if not is_admin(st.session_state.get("email", "")):
+        st.error("You don't have access to this page.")
+        return
+    metrics_section()
+    backup_section()
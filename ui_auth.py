@@ -1,107 +1,157 @@
 import streamlit as st
 import time
-from sheet_manager import register_user, login_user, load_config, find_user
-from email_sender import send_2fa_code
+import metrics
+from streamlit_autorefresh import st_autorefresh
+from sheet_manager import register_hashed_user, authenticate_user, parse_config, hash_password
+from email_sender import queue_2fa_code, mail_status
+from verification_store import get_verification_store, CODE_TTL_SECONDS
 from utils import is_valid_email, generate_6_digit_code, config_hash, can_resend_code
 
+# Query parameter carrying the pending-registration token, so a verification
+# started on one server worker can be finished on any other.
+TOKEN_PARAM = "verify"
+
+def start_verification(token, job_id):
+    st.session_state.pending_token = token
+    st.session_state.mail_job_id = job_id
+    st.query_params[TOKEN_PARAM] = token
+
+def clear_verification():
+    st.session_state.pending_token = ""
+    st.session_state.mail_job_id = ""
+    if TOKEN_PARAM in st.query_params:
+        del st.query_params[TOKEN_PARAM]
+
 def verify_2fa_ui():
     st.title("🔐 Email Verification")
 
-    st.info(f"A 6-digit verification code was sent to `{st.session_state.pending_email}`. It will be valid for 1 minute.")
-    seconds_passed = int(time.time() - st.session_state.code_sent_time)
-    seconds_left = max(0, 60 - seconds_passed)
+    store = get_verification_store()
+    token = st.session_state.pending_token
+    pending = store.get(token)
+    if pending is None:
+        st.warning("⏳ This verification has expired. Please register again.")
+        if st.button("Back to login"):
+            clear_verification()
+            st.rerun()
+        return
+
+    st.info(f"A 6-digit verification code was sent to `{pending.email}`. It will be valid for 1 minute.")
+    seconds_passed = int(time.time() - pending.sent_at)
+    resend_allowed = can_resend_code(pending.sent_at)
+
+    status = mail_status(st.session_state.mail_job_id)
+    if status in ("queued", "sending"):
+        st.caption("📨 Sending your verification code…")
+        st_autorefresh(interval=1000, limit=30, key=f"mail_poll_{st.session_state.mail_job_id}")
+    elif status == "failed":
+        st.error("❌ Failed to send verification code. Please use Resend Code to try again.")
+        resend_allowed = True
+    elif status == "sent":
+        st.caption("✅ Verification code sent.")
 
     code_input = st.text_input("Enter your 6-digit verification code", max_chars=6)
     col1, col2, col3 = st.columns([3, 2, 1])
     verify_clicked = col1.button("Verify Code")
-    resend_clicked = col2.button("Resend Code", disabled=seconds_left > 0)
+    resend_clicked = col2.button("Resend Code", disabled=not resend_allowed)
     cancel_clicked = col3.button("❌ Cancel")
 
     if verify_clicked:
-        if seconds_passed > 60:
+        verify_code(store, token, code_input, seconds_passed)
+
+    if resend_clicked:
+        with metrics.action("resend_code"):
+            resend_code(store, token, pending.email)
+
+    if cancel_clicked:
+        store.delete(token)
+        clear_verification()
+        st.rerun()
+
+def verify_code(store, token, code_input, seconds_passed):
+    with metrics.action("verify_2fa"):
+        if seconds_passed > CODE_TTL_SECONDS:
             st.error("⏳ This code has expired. Please request a new one.")
         elif len(code_input) != 6:
             st.warning("Please enter all 6 digits of the verification code.")
-        elif code_input != st.session_state.generated_code:
-            st.error("❌ Invalid code. Please try again.")
         else:
-            ok, msg = register_user(st.session_state.pending_email, st.session_state.pending_password)
-            if ok:
-                st.session_state.logged_in = True
-                st.session_state.awaiting_2fa = False
-                st.session_state.email = st.session_state.pending_email
-                st.session_state.config = load_config(st.session_state.email) or {}
-                st.session_state.config_key_suffix = config_hash(st.session_state.config)
-                st.session_state.generated_code = ""
-                st.session_state.pending_email = ""
-                st.session_state.pending_password = ""
-                st.session_state.code_sent_time = 0
-                st.success("✅ Registration successful.")
-                st.rerun()
+            result, entry = store.check_code(token, code_input)
+            if result == "ok":
+                row_num, user = register_hashed_user(entry.email, entry.password_hash)
+                clear_verification()
+                if row_num:
+                    st.session_state.logged_in = True
+                    st.session_state.email = entry.email
+                    st.session_state.config = parse_config(user)
+                    st.session_state.config_key_suffix = config_hash(st.session_state.config)
+                    st.success("✅ Registration successful.")
+                    st.rerun()
+                else:
+                    st.error("❌ An account with this email already exists. Please log in instead.")
+            elif result == "invalid":
+                st.error(f"❌ Invalid code. Please try again ({entry.attempts_left} attempts left).")
+            elif result == "locked":
+                st.error("🔒 Too many incorrect attempts. Please request a new code.")
+            elif result == "expired":
+                st.error("⏳ This code has expired. Please request a new one.")
             else:
-                st.error(msg)
+                st.warning("⏳ This verification has expired. Please register again.")
 
-    if resend_clicked:
-        code = generate_6_digit_code()
-        st.session_state.generated_code = code
-        sent = send_2fa_code(st.session_state.pending_email, code)
-        if sent:
-            st.session_state.code_sent_time = time.time()
-            st.success("✅ Verification code resent.")
-        else:
-            st.error("❌ Failed to send verification code.")
-
-    if cancel_clicked:
-        st.session_state.awaiting_2fa = False
-        st.session_state.pending_email = ""
-        st.session_state.pending_password = ""
-        st.session_state.generated_code = ""
-        st.session_state.code_sent_time = 0
-        st.rerun()
+def resend_code(store, token, email):
+    code = generate_6_digit_code()
+    if store.reissue(token, code):
+        job = queue_2fa_code(email, code)
+        if job.status != "failed":
+            st.session_state.mail_job_id = job.id
+            st.rerun()
+    st.error("❌ Failed to send verification code.")
 
 def login_form_ui():
     email = st.text_input("Email", key="email_input")
     password = st.text_input("Password", type="password", key="password_input")
 
     if st.button("Continue"):
-        if not email or not password:
-            st.warning("Please enter both email and password.")
-            return
-        if not is_valid_email(email):
-            st.error("❌ Please enter a valid email address.")
-            return
-
-        row_num, user = find_user(email)
-        if user:
-            ok, msg, _ = login_user(email, password)
-            if ok:
-                st.session_state.logged_in = True
-                st.session_state.email = email
-                st.session_state.config = load_config(email) or {}
-                st.session_state.config_key_suffix = config_hash(st.session_state.config)
-                st.success("Login successful.")
-                st.rerun()
-            else:
-                st.error(msg)
+        with metrics.action("login"):
+            submit_login(email, password)
+
+def submit_login(email, password):
+    if not email or not password:
+        st.warning("Please enter both email and password.")
+        return
+    if not is_valid_email(email):
+        st.error("❌ Please enter a valid email address.")
+        return
+
+    ok, msg, _, user, config = authenticate_user(email, password)
+    if user:
+        if ok:
+            st.session_state.logged_in = True
+            st.session_state.email = email
+            st.session_state.config = config or {}
+            st.session_state.config_key_suffix = config_hash(st.session_state.config)
+            st.success("Login successful.")
+            st.rerun()
         else:
-            code = generate_6_digit_code()
-            sent = send_2fa_code(email, code)
-            if sent:
-                st.session_state.awaiting_2fa = True
-                st.session_state.pending_email = email
-                st.session_state.pending_password = password
-                st.session_state.generated_code = code
-                st.session_state.code_sent_time = time.time()
-                st.info(f"A 6-digit verification code has been sent to {email}. Please enter it below.")
-                st.rerun()
-            else:
-                st.error("Failed to send verification code. Please try again later.")
+            st.error(msg)
+    else:
+        code = generate_6_digit_code()
+        store = get_verification_store()
+        token = store.create(email, hash_password(password), code)
+        job = queue_2fa_code(email, code)
+        if job.status != "failed":
+            start_verification(token, job.id)
+            st.info(f"A 6-digit verification code has been sent to {email}. Please enter it below.")
+            st.rerun()
+        else:
+            store.delete(token)
+            st.error("Failed to send verification code. Please try again later.")
 
 def login_ui():
     if st.session_state.logged_in:
         return
     st.title("🔐 Login or Register")
-    if st.session_state.awaiting_2fa:
+    if not st.session_state.pending_token and TOKEN_PARAM in st.query_params:
+        st.session_state.pending_token = st.query_params[TOKEN_PARAM]
+    if st.session_state.pending_token:
         verify_2fa_ui()
     else:
         login_form_ui()
@@ -1,30 +1,58 @@
 import streamlit as st
 import json
+import metrics
+from datetime import datetime
 from utils import config_hash
-from sheet_manager import save_config
+from config_model import validate_config, CLOCK_POSITIONS
+from sheet_manager import save_config, load_config, save_status, config_versions, load_config_version
+from config_history import diff_configs
+from stop_index import load_stop_index
 
 
 def general_settings_section(config, key_suffix):
     st.subheader("General Settings")
-    title = st.text_input("Page Title", config.get("custom_title", ""), key=f"title_{key_suffix}")
-    refresh_interval = st.number_input("Auto-refresh (seconds)", 5, 120, config.get("refresh_interval_seconds", 30), key=f"refresh_{key_suffix}")
+    title = st.text_input("Page Title", config.custom_title, key=f"title_{key_suffix}")
+    refresh_interval = st.number_input("Auto-refresh (seconds)", 5, 120, config.refresh_interval_seconds, key=f"refresh_{key_suffix}")
     return title, refresh_interval
 
 
 def layout_section(layout, key_suffix):
     with st.expander("📐 Layout Settings"):
         view_col, col_col = st.columns(2)
-        view = view_col.selectbox("View", ["grid", "list"], index=["grid", "list"].index(layout.get("view", "grid")), key=f"view_{key_suffix}")
-        columns = col_col.number_input("Columns per row", 1, 5, layout.get("columns_per_row", 3), key=f"columns_{key_suffix}")
-        stops = st.text_input("Stop IDs (comma-separated)", ",".join(layout.get("stop_order", [])), key=f"stops_{key_suffix}").split(",")
-        padding = st.number_input("Padding between cards (px)", 0, 64, layout.get("padding_between_cards", 16), key=f"padding_{key_suffix}")
-        border_radius = st.number_input("Card border radius (px)", 0, 30, layout.get("card_border_radius", 12), key=f"radius_{key_suffix}")
+        view = view_col.selectbox("View", ["grid", "list"], index=["grid", "list"].index(layout.view), key=f"view_{key_suffix}")
+        columns = col_col.number_input("Columns per row", 1, 5, layout.columns_per_row, key=f"columns_{key_suffix}")
+        stops = stop_picker(layout.stop_order, key_suffix)
+        padding = st.number_input("Padding between cards (px)", 0, 64, layout.padding_between_cards, key=f"padding_{key_suffix}")
+        border_radius = st.number_input("Card border radius (px)", 0, 30, layout.card_border_radius, key=f"radius_{key_suffix}")
     return view, columns, stops, padding, border_radius
 
 
+def stop_picker(stop_order, key_suffix):
+    index = load_stop_index()
+    if index is None:
+        # No stop index built on this server: free-text IDs as before.
+        return st.text_input("Stop IDs (comma-separated)", ",".join(stop_order), key=f"stops_{key_suffix}").split(",")
+
+    key = f"stops_{key_suffix}"
+    selected = st.session_state.get(key, list(stop_order))
+    query = st.text_input("Search stops", key=f"stop_search_{key_suffix}", placeholder="Stop name, ID or code")
+    # Saved stops stay in the options, so unselecting one keeps `default` valid.
+    options = list(dict.fromkeys(list(stop_order) + selected + [stop.stop_id for stop in index.search(query)]))
+
+    def label(stop_id):
+        stop = index.get(stop_id)
+        return stop.label if stop else f"⚠️ {stop_id} (unknown stop)"
+
+    stops = st.multiselect("Stops (in display order)", options, default=list(stop_order), key=key, format_func=label)
+    unknown = index.unknown(stops)
+    if unknown:
+        st.warning(f"Unknown stop IDs: {', '.join(unknown)}. Remove them before saving.")
+    return stops
+
+
 def display_section(display, key_suffix):
     with st.expander("🖥️ Display Options"):
-        departures = st.slider("Departures per stop", 1, 10, display.get("departures_per_stop", 5), key=f"departures_{key_suffix}")
+        departures = st.slider("Departures per stop", 1, 10, display.departures_per_stop, key=f"departures_{key_suffix}")
         show_opts = [
             ("Show wheelchair icon ♿", "show_wheelchair_icon"),
             ("Show stop location 📍", "show_stop_location"),
@@ -36,77 +64,74 @@ def display_section(display, key_suffix):
             ("Show route short name", "show_route_short_name"),
             ("Use 24h time", "use_24h_time")
         ]
-        flags = {key: st.checkbox(label, display.get(key, False), key=f"{key}_{key_suffix}") for label, key in show_opts}
-        max_age = st.number_input("Max departure age (sec)", 30, 600, display.get("max_departure_age_seconds", 180), key=f"age_{key_suffix}")
+        flags = {key: st.checkbox(label, getattr(display, key), key=f"{key}_{key_suffix}") for label, key in show_opts}
+        max_age = st.number_input("Max departure age (sec)", 30, 600, display.max_departure_age_seconds, key=f"age_{key_suffix}")
     return departures, max_age, flags
 
 
 def font_section(fonts, key_suffix):
     with st.expander("🔤 Font Settings"):
-        title_font = st.text_input("Title Font Family", fonts.get("title", {}).get("family", "Roboto"), key=f"title_font_{key_suffix}")
-        title_size = st.number_input("Title Font Size", 10, 100, fonts.get("title", {}).get("size", 32), key=f"title_size_{key_suffix}")
-        subtitle_font = st.text_input("Subtitle Font Family", fonts.get("subtitle", {}).get("family", "Roboto"), key=f"subtitle_font_{key_suffix}")
-        subtitle_size = st.number_input("Subtitle Font Size", 10, 60, fonts.get("subtitle", {}).get("size", 24), key=f"subtitle_size_{key_suffix}")
-        text_font = st.text_input("Text Font Family", fonts.get("text", {}).get("family", "Roboto"), key=f"text_font_{key_suffix}")
-        text_size = st.number_input("Text Font Size", 10, 40, fonts.get("text", {}).get("size", 16), key=f"text_size_{key_suffix}")
-        time_font = fonts.get("time", {}).get("family", "Roboto Mono")
-        time_size = fonts.get("time", {}).get("size", 20)
+        title_font = st.text_input("Title Font Family", fonts.title.family, key=f"title_font_{key_suffix}")
+        title_size = st.number_input("Title Font Size", 10, 100, fonts.title.size, key=f"title_size_{key_suffix}")
+        subtitle_font = st.text_input("Subtitle Font Family", fonts.subtitle.family, key=f"subtitle_font_{key_suffix}")
+        subtitle_size = st.number_input("Subtitle Font Size", 10, 60, fonts.subtitle.size, key=f"subtitle_size_{key_suffix}")
+        text_font = st.text_input("Text Font Family", fonts.text.family, key=f"text_font_{key_suffix}")
+        text_size = st.number_input("Text Font Size", 10, 40, fonts.text.size, key=f"text_size_{key_suffix}")
     return {
-        "title": {"family": title_font, "size": title_size, "weight": "bold"},
-        "subtitle": {"family": subtitle_font, "size": subtitle_size, "weight": "normal"},
-        "text": {"family": text_font, "size": text_size, "weight": "normal"},
-        "time": {"family": time_font, "size": time_size, "weight": "medium"}
+        "title": {"family": title_font, "size": title_size, "weight": fonts.title.weight},
+        "subtitle": {"family": subtitle_font, "size": subtitle_size, "weight": fonts.subtitle.weight},
+        "text": {"family": text_font, "size": text_size, "weight": fonts.text.weight},
+        "time": fonts.time.to_dict()
     }
 
 
 def clock_style_section(clock_style, clock_settings, key_suffix):
     with st.expander("🕒 Clock Settings"):
-        font_family = st.text_input("Clock Font Family", clock_style.get("font_family", "Roboto"), key=f"clock_font_{key_suffix}")
-        font_size = st.number_input("Clock Font Size", 10, 60, clock_style.get("font_size", 20), key=f"clock_size_{key_suffix}")
-        text_color = st.color_picker("Clock Text Color", clock_style.get("text_color", "#333333"), key=f"clock_color_{key_suffix}")
-        show = st.checkbox("Show clock", clock_settings.get("show", True), key=f"clock_show_{key_suffix}")
-        position = st.selectbox("Clock Position", ["top-left", "top-right", "bottom-left", "bottom-right"],
-                                index=["top-left", "top-right", "bottom-left", "bottom-right"].index(clock_settings.get("position", "top-right")),
+        font_family = st.text_input("Clock Font Family", clock_style.font_family, key=f"clock_font_{key_suffix}")
+        font_size = st.number_input("Clock Font Size", 10, 60, clock_style.font_size, key=f"clock_size_{key_suffix}")
+        text_color = st.color_picker("Clock Text Color", clock_style.text_color, key=f"clock_color_{key_suffix}")
+        show = st.checkbox("Show clock", clock_settings.show, key=f"clock_show_{key_suffix}")
+        position = st.selectbox("Clock Position", list(CLOCK_POSITIONS),
+                                index=CLOCK_POSITIONS.index(clock_settings.position),
                                 key=f"clock_pos_{key_suffix}")
-    return {"font_family": font_family, "font_size": font_size, "font_weight": "bold", "text_color": text_color}, {"show": show, "position": position}
+    return {"font_family": font_family, "font_size": font_size, "font_weight": clock_style.font_weight, "text_color": text_color}, {"show": show, "position": position}
 
 
 def color_section(colors, style, key_suffix):
     with st.expander("🎨 Color Settings"):
-        text_color = st.color_picker("Text Color", colors.get("text", "#000000"), key=f"text_color_{key_suffix}")
-        card_color = st.color_picker("Card Background", colors.get("card_background", "#f8f8f8"), key=f"card_bg_{key_suffix}")
-        border_color = st.color_picker("Card Border Color", colors.get("card_border", "#dddddd"), key=f"border_color_{key_suffix}")
-        highlight_color = st.color_picker("Highlight Color", colors.get("highlight_departure", "#ff0000"), key=f"highlight_{key_suffix}")
-        shadow = st.checkbox("Card shadow", style.get("card_shadow", True), key=f"shadow_{key_suffix}")
-        border = st.checkbox("Card border", style.get("card_border", True), key=f"border_{key_suffix}")
+        text_color = st.color_picker("Text Color", colors.text, key=f"text_color_{key_suffix}")
+        card_color = st.color_picker("Card Background", colors.card_background, key=f"card_bg_{key_suffix}")
+        border_color = st.color_picker("Card Border Color", colors.card_border, key=f"border_color_{key_suffix}")
+        highlight_color = st.color_picker("Highlight Color", colors.highlight_departure, key=f"highlight_{key_suffix}")
+        shadow = st.checkbox("Card shadow", style.card_shadow, key=f"shadow_{key_suffix}")
+        border = st.checkbox("Card border", style.card_border, key=f"border_{key_suffix}")
     return {
+        **colors.to_dict(),
         "text": text_color,
-        "background": "#ffffff",
         "card_background": card_color,
         "card_border": border_color,
-        "highlight_departure": highlight_color,
-        "clock_text": colors.get("clock_text", "#333333")
+        "highlight_departure": highlight_color
     }, shadow, border
 
 
 def emoji_section(emojis, key_suffix):
     with st.expander("🚍 Emoji Settings"):
-        bus = st.text_input("Bus emoji", emojis.get("bus", "🚍"), key=f"bus_{key_suffix}")
-        tram = st.text_input("Tram emoji", emojis.get("tram", "🚋"), key=f"tram_{key_suffix}")
-        metro = st.text_input("Metro emoji", emojis.get("metro", "🚇"), key=f"metro_{key_suffix}")
+        bus = st.text_input("Bus emoji", emojis.bus, key=f"bus_{key_suffix}")
+        tram = st.text_input("Tram emoji", emojis.tram, key=f"tram_{key_suffix}")
+        metro = st.text_input("Metro emoji", emojis.metro, key=f"metro_{key_suffix}")
     return {"bus": bus, "tram": tram, "metro": metro}
 
 
 def highlight_zone_section(zone, key_suffix):
     with st.expander("🔶 Top Highlight Zone"):
-        enabled = st.checkbox("Enable Top Highlight", zone.get("enabled", True), key=f"zone_enabled_{key_suffix}")
-        minutes = st.number_input("Highlight within minutes", 1, 30, zone.get("minutes_threshold", 5), key=f"zone_min_{key_suffix}")
-        max_items = st.number_input("Max items in zone", 1, 10, zone.get("max_items", 3), key=f"zone_max_{key_suffix}")
-        font_size = st.number_input("Highlight font size", 10, 40, zone.get("font_size", 22), key=f"zone_font_size_{key_suffix}")
-        font_family = st.text_input("Highlight font family", zone.get("font_family", "Roboto"), key=f"zone_font_family_{key_suffix}")
-        text_color = st.color_picker("Highlight font color", zone.get("text_color", "#ff6600"), key=f"zone_text_color_{key_suffix}")
-        show_icon = st.checkbox("Show route icon", zone.get("show_route_icon", True), key=f"zone_icon_{key_suffix}")
-        countdown = st.checkbox("Show countdown", zone.get("show_countdown", True), key=f"zone_countdown_{key_suffix}")
+        enabled = st.checkbox("Enable Top Highlight", zone.enabled, key=f"zone_enabled_{key_suffix}")
+        minutes = st.number_input("Highlight within minutes", 1, 30, zone.minutes_threshold, key=f"zone_min_{key_suffix}")
+        max_items = st.number_input("Max items in zone", 1, 10, zone.max_items, key=f"zone_max_{key_suffix}")
+        font_size = st.number_input("Highlight font size", 10, 40, zone.font_size, key=f"zone_font_size_{key_suffix}")
+        font_family = st.text_input("Highlight font family", zone.font_family, key=f"zone_font_family_{key_suffix}")
+        text_color = st.color_picker("Highlight font color", zone.text_color, key=f"zone_text_color_{key_suffix}")
+        show_icon = st.checkbox("Show route icon", zone.show_route_icon, key=f"zone_icon_{key_suffix}")
+        countdown = st.checkbox("Show countdown", zone.show_countdown, key=f"zone_countdown_{key_suffix}")
     return {
         "enabled": enabled,
         "minutes_threshold": minutes,
@@ -119,6 +144,197 @@ def highlight_zone_section(zone, key_suffix):
     }
 
 
+# Sections rerun on their own when one of their widgets changes (Streamlit
+# fragments); older Streamlit versions fall back to full-script reruns.
+fragment = getattr(st, "fragment", None) or getattr(st, "experimental_fragment", None)
+if fragment is None:
+    def fragment(func=None, **_):
+        return func if func is not None else (lambda f: f)
+
+def empty_draft():
+    # Same key order as the template, so the preview reads the same way.
+    return {
+        "custom_title": "",
+        "refresh_interval_seconds": 30,
+        "layout": {},
+        "display": {},
+        "style": {
+            "color_by_route": True,
+            "card_shadow": True,
+            "card_border": True,
+            "fonts": {},
+            "clock": {},
+            "colors": {},
+            "custom_emojis": {}
+        },
+        "clock": {},
+        "top_highlight_zone": {}
+    }
+
+
+def update_draft(**changes):
+    """Apply one section's output to the draft and invalidate its cached JSON."""
+    draft = st.session_state.draft_config
+    for path, value in changes.items():
+        target = draft
+        *parents, key = path.split("__")
+        for parent in parents:
+            target = target[parent]
+        if target.get(key) != value:
+            target[key] = value
+            st.session_state.draft_json = None
+
+
+def draft_json():
+    """Pretty JSON of the draft for the preview and download, kept until the draft changes."""
+    if st.session_state.draft_json is None:
+        st.session_state.draft_json = json.dumps(st.session_state.draft_config, indent=2, ensure_ascii=False)
+    return st.session_state.draft_json
+
+
+@fragment
+def general_fragment(config, key_suffix):
+    title, refresh_interval = general_settings_section(config, key_suffix)
+    update_draft(custom_title=title, refresh_interval_seconds=refresh_interval)
+
+
+@fragment
+def layout_fragment(config, key_suffix):
+    view, columns, stops, padding, radius = layout_section(config.layout, key_suffix)
+    update_draft(layout={
+        "view": view,
+        "columns_per_row": columns,
+        "stop_order": [s.strip() for s in stops if s.strip()],
+        "padding_between_cards": padding,
+        "card_border_radius": radius
+    })
+
+
+@fragment
+def display_fragment(config, key_suffix):
+    departures, max_age, display_flags = display_section(config.display, key_suffix)
+    update_draft(display={
+        "departures_per_stop": departures,
+        "max_departure_age_seconds": max_age,
+        **display_flags
+    })
+
+
+@fragment
+def font_fragment(config, key_suffix):
+    update_draft(style__fonts=font_section(config.style.fonts, key_suffix))
+
+
+@fragment
+def clock_fragment(config, key_suffix):
+    clock_style, clock = clock_style_section(config.style.clock, config.clock, key_suffix)
+    update_draft(style__clock=clock_style, clock=clock)
+
+
+@fragment
+def color_fragment(config, key_suffix):
+    colors, shadow, border = color_section(config.style.colors, config.style, key_suffix)
+    update_draft(style__colors=colors, style__card_shadow=shadow, style__card_border=border)
+
+
+@fragment
+def emoji_fragment(config, key_suffix):
+    update_draft(style__custom_emojis=emoji_section(config.style.custom_emojis, key_suffix))
+
+
+@fragment
+def highlight_zone_fragment(config, key_suffix):
+    update_draft(top_highlight_zone=highlight_zone_section(config.top_highlight_zone, key_suffix))
+
+
+@fragment
+def preview_fragment():
+    # Sections rerun on their own, so this only catches up on full reruns or on request.
+    st.button("🔄 Refresh preview")
+    config_json = draft_json()
+    st.code(config_json, language="json")
+    st.download_button("⬇️ Download config.json", config_json, file_name="config.json", mime="application/json")
+
+
+@fragment
+def save_fragment(config):
+    if st.button("Save to My Config"):
+        with metrics.action("save_config"):
+            new_config = validate_config(st.session_state.draft_config)[0].to_dict()
+            index = load_stop_index()
+            unknown = index.unknown(new_config["layout"]["stop_order"]) if index else []
+            if unknown:
+                st.error(f"❌ Unknown stop IDs: {', '.join(unknown)}.")
+            else:
+                ok, msg = save_config(st.session_state["email"], new_config, base_hash=config_hash(config))
+                if ok:
+                    st.session_state.config = new_config
+                    st.session_state.config_key_suffix = config_hash(new_config)
+                    st.success(msg)
+                    st.rerun()
+                else:
+                    st.error(msg)
+
+    status = save_status(st.session_state["email"])
+    if status == "pending":
+        st.caption("⏳ Saving your latest changes in the background…")
+    elif status == "failed":
+        st.caption("⚠️ Background save failed, retrying shortly.")
+    elif status == "dropped":
+        st.caption("❌ Your last change could not be saved. Reload your config and save again.")
+    elif status == "flushed":
+        st.caption("✅ All changes are saved.")
+
+    if st.button("🔄 Reload Saved Config"):
+        with metrics.action("reload_config"):
+            st.session_state.config = load_config(st.session_state["email"]) or {}
+        st.session_state.config_key_suffix = config_hash(st.session_state.config)
+        st.rerun()
+
+
+def history_section(config):
+    versions = config_versions(st.session_state["email"])
+    if not versions:
+        return
+    with st.expander("🕘 Version History"):
+        current_hash = config_hash(config)
+
+        def label(version):
+            saved_at = datetime.fromtimestamp(version.saved_at).strftime("%Y-%m-%d %H:%M")
+            current = " (current)" if version.config_hash == current_hash else ""
+            return f"v{version.version} · {saved_at} · {version.config_hash}{current}"
+
+        version = st.selectbox("Version", versions, format_func=label)
+        if version.config_hash == current_hash:
+            st.caption("This is the config you are editing.")
+            return
+        old_config = load_config_version(st.session_state["email"], version.version)
+        if old_config is None:
+            st.warning("This version is no longer available.")
+            return
+        delta = diff_configs(config, old_config)
+        rows = [{"Setting": ".".join(path), "Restores": json.dumps(value, ensure_ascii=False)} for path, value in delta["set"]]
+        rows += [{"Setting": ".".join(path), "Restores": "(removed)"} for path in delta["unset"]]
+        st.dataframe(rows, use_container_width=True, hide_index=True)
+        # Restores skip the stop check on purpose: a stop retired since must not block a rollback.
+        index = load_stop_index()
+        unknown = index.unknown(old_config["layout"]["stop_order"]) if index else []
+        if unknown:
+            st.warning(f"⚠️ No longer in the stop list: {', '.join(unknown)}.")
+        st.caption("Restoring does not count against your daily upload limit.")
+
+        if st.button(f"↩️ Restore v{version.version}"):
+            with metrics.action("restore_config"):
+                ok, msg = save_config(st.session_state["email"], old_config, base_hash=current_hash, restore=True)
+            if ok:
+                st.session_state.config = old_config
+                st.session_state.config_key_suffix = config_hash(old_config)
+                st.success(msg)
+                st.rerun()
+            else:
+                st.error(msg)
+
+
 def show_config_editor():
     st.title("🛠️ BKK Display Config Editor")
 
@@ -129,55 +345,23 @@ def show_config_editor():
     config = st.session_state.get("config", {})
     key_suffix = st.session_state.get("config_key_suffix", "default")
 
-    title, refresh_interval = general_settings_section(config, key_suffix)
-    view, columns, stops, padding, radius = layout_section(config.get("layout", {}), key_suffix)
-    departures, max_age, display_flags = display_section(config.get("display", {}), key_suffix)
-    fonts = font_section(config.get("style", {}).get("fonts", {}), key_suffix)
-    clock_style, clock = clock_style_section(config.get("style", {}).get("clock", {}), config.get("clock", {}), key_suffix)
-    colors, shadow, border = color_section(config.get("style", {}).get("colors", {}), config.get("style", {}), key_suffix)
-    emojis = emoji_section(config.get("style", {}).get("custom_emojis", {}), key_suffix)
-    highlight_zone = highlight_zone_section(config.get("top_highlight_zone", {}), key_suffix)
-
-    new_config = {
-        "custom_title": title,
-        "refresh_interval_seconds": refresh_interval,
-        "layout": {
-            "view": view,
-            "columns_per_row": columns,
-            "stop_order": [s.strip() for s in stops if s.strip()],
-            "padding_between_cards": padding,
-            "card_border_radius": radius
-        },
-        "display": {
-            "departures_per_stop": departures,
-            "max_departure_age_seconds": max_age,
-            **display_flags
-        },
-        "style": {
-            "color_by_route": True,
-            "card_shadow": shadow,
-            "card_border": border,
-            "fonts": fonts,
-            "clock": clock_style,
-            "colors": colors,
-            "custom_emojis": emojis
-        },
-        "clock": clock,
-        "top_highlight_zone": highlight_zone
-    }
+    # Start a fresh draft whenever a different config is loaded or saved.
+    if st.session_state.get("draft_suffix") != key_suffix:
+        st.session_state.draft_config = empty_draft()
+        st.session_state.draft_json = None
+        st.session_state.draft_suffix = key_suffix
 
-    st.subheader("💾 Save Config")
-    config_json = json.dumps(new_config, indent=2, ensure_ascii=False)
-    st.code(config_json, language="json")
+    model, _ = validate_config(config)
+    general_fragment(model, key_suffix)
+    layout_fragment(model, key_suffix)
+    display_fragment(model, key_suffix)
+    font_fragment(model, key_suffix)
+    clock_fragment(model, key_suffix)
+    color_fragment(model, key_suffix)
+    emoji_fragment(model, key_suffix)
+    highlight_zone_fragment(model, key_suffix)
 
-    if st.button("Save to My Config"):
-        ok, msg = save_config(st.session_state["email"], new_config)
-        if ok:
-            st.session_state.config = new_config
-            st.session_state.config_key_suffix = config_hash(new_config)
-            st.success(msg)
-            st.rerun()
-        else:
-            st.error(msg)
-
-    st.download_button("⬇️ Download config.json", config_json, file_name="config.json", mime="application/json")
+    st.subheader("💾 Save Config")
+    preview_fragment()
+    save_fragment(config)
+    history_section(config)
@@ -1,9 +1,25 @@
 import json
 import hashlib
+import os
 import random
 import time
 import streamlit as st
 
+def get_setting(name: str, default=None):
+    """Read a setting from Streamlit secrets, falling back to the environment."""
+    try:
+        if name in st.secrets:
+            return st.secrets[name]
+    except Exception:
+        pass  # No secrets file (e.g. scripts run outside `streamlit run`)
+    return os.environ.get(name, default)
+
+def get_flag(name: str, default: bool = False) -> bool:
+    value = get_setting(name, default)
+    if isinstance(value, str):
+        return value.strip().lower() in ("1", "true", "yes", "on")
+    return bool(value)
+
 def config_hash(config: dict) -> str:
     return hashlib.md5(json.dumps(config, sort_keys=True).encode()).hexdigest()[:8]
 
@@ -13,8 +29,8 @@ def is_valid_email(email: str) -> bool:
 def generate_6_digit_code() -> str:
     return f"{random.randint(100000, 999999)}"
 
-def can_resend_code() -> bool:
-    return time.time() - st.session_state.code_sent_time > 60
+def can_resend_code(sent_at: float) -> bool:
+    return time.time() - sent_at > 60
 
 def countdown_timer(seconds_left: int):
     countdown_placeholder = st.empty()
@@ -0,0 +1,249 @@
+import hashlib
+import heapq
+import secrets
+import sqlite3
+import threading
+import time
+from dataclasses import dataclass, replace
+import streamlit as st
+from utils import get_setting
+
+# A code is accepted for this long after it was (re)sent.
+CODE_TTL_SECONDS = 60
+# A pending registration is forgotten this long after the last code was sent.
+PENDING_TTL_SECONDS = 15 * 60
+MAX_ATTEMPTS = 5
+
+
+@dataclass
+class PendingVerification:
+    token: str
+    email: str
+    password_hash: str
+    code_hash: str
+    sent_at: float
+    attempts: int = 0
+
+    @property
+    def attempts_left(self) -> int:
+        return max(0, MAX_ATTEMPTS - self.attempts)
+
+
+def _code_hash(token: str, code: str) -> str:
+    # Only a salted hash of the code is stored, never the code itself.
+    return hashlib.sha256(f"{token}:{code}".encode()).hexdigest()
+
+
+def _verify(entry, code, now):
+    """Decide a code attempt: "ok", "invalid", "expired" or "locked"."""
+    if entry.attempts >= MAX_ATTEMPTS:
+        return "locked"
+    if now - entry.sent_at > CODE_TTL_SECONDS:
+        return "expired"
+    if not secrets.compare_digest(entry.code_hash, _code_hash(entry.token, code)):
+        return "invalid"
+    return "ok"
+
+
+class VerificationStore:
+    """
+    Pending 2FA registrations keyed by an opaque token.
+
+    Entries expire PENDING_TTL_SECONDS after the last code was sent and are
+    evicted lazily on access. `check_code` counts attempts and consumes the
+    entry on success, so a code can be used only once.
+    """
+
+    def create(self, email, password_hash, code) -> str:
+        token = secrets.token_urlsafe(24)
+        self._put(PendingVerification(token, email, password_hash, _code_hash(token, code), time.time()))
+        return token
+
+    def get(self, token):
+        raise NotImplementedError
+
+    def check_code(self, token, code):
+        """Return (result, entry); result is "missing" if the token is unknown or expired."""
+        raise NotImplementedError
+
+    def reissue(self, token, code) -> bool:
+        """Replace the code of a pending entry and reset its attempt counter."""
+        raise NotImplementedError
+
+    def delete(self, token):
+        raise NotImplementedError
+
+    def _put(self, entry):
+        raise NotImplementedError
+
+
+class MemoryVerificationStore(VerificationStore):
+    """Per-process store; evicts expired entries and caps the total count."""
+
+    def __init__(self, max_entries=10000):
+        self._max_entries = max_entries
+        self._lock = threading.Lock()
+        self._entries = {}
+        self._expiry = []  # heap of (sent_at, token), may hold stale items
+
+    def get(self, token):
+        with self._lock:
+            now = time.time()
+            self._evict(now)
+            entry = self._live(token, now)
+            return replace(entry) if entry else None
+
+    def check_code(self, token, code):
+        now = time.time()
+        with self._lock:
+            self._evict(now)
+            entry = self._live(token, now)
+            if entry is None:
+                return "missing", None
+            result = _verify(entry, code, now)
+            if result == "ok":
+                del self._entries[token]
+            elif result == "invalid":
+                entry.attempts += 1
+            return result, replace(entry)
+
+    def reissue(self, token, code) -> bool:
+        with self._lock:
+            entry = self._live(token, time.time())
+            if entry is None:
+                return False
+            entry.code_hash = _code_hash(token, code)
+            entry.sent_at = time.time()
+            entry.attempts = 0
+            heapq.heappush(self._expiry, (entry.sent_at, token))
+        return True
+
+    def delete(self, token):
+        with self._lock:
+            self._entries.pop(token, None)
+
+    def _put(self, entry):
+        with self._lock:
+            self._entries[entry.token] = entry
+            heapq.heappush(self._expiry, (entry.sent_at, entry.token))
+            self._evict(time.time())
+
+    def _live(self, token, now):
+        entry = self._entries.get(token)
+        if entry is not None and now - entry.sent_at > PENDING_TTL_SECONDS:
+            del self._entries[token]
+            return None
+        return entry
+
+    def _evict(self, now):
+        while self._expiry:
+            sent_at, token = self._expiry[0]
+            entry = self._entries.get(token)
+            if entry is not None and entry.sent_at != sent_at:
+                heapq.heappop(self._expiry)  # Superseded by a reissue
+                continue
+            if now - sent_at <= PENDING_TTL_SECONDS and len(self._entries) <= self._max_entries:
+                break
+            heapq.heappop(self._expiry)
+            self._entries.pop(token, None)
+
+
+class SQLiteVerificationStore(VerificationStore):
+    """Store shared by every worker that can reach the same database file."""
+
+    def __init__(self, path="verification.db"):
+        self._path = path
+        self._local = threading.local()
+        conn = self._conn()
+        conn.execute("PRAGMA journal_mode=WAL")
+        with conn:
+            conn.execute(
+                """CREATE TABLE IF NOT EXISTS pending_verifications (
+                    token TEXT PRIMARY KEY,
+                    email TEXT NOT NULL,
+                    password_hash TEXT NOT NULL,
+                    code_hash TEXT NOT NULL,
+                    sent_at REAL NOT NULL,
+                    attempts INTEGER NOT NULL DEFAULT 0
+                )"""
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS pending_sent_at ON pending_verifications (sent_at)")
+
+    def _conn(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self._path, timeout=30, isolation_level=None)
+            conn.row_factory = sqlite3.Row
+            self._local.conn = conn
+        return conn
+
+    def _evict(self, conn):
+        conn.execute("DELETE FROM pending_verifications WHERE sent_at < ?", (time.time() - PENDING_TTL_SECONDS,))
+
+    @staticmethod
+    def _entry(row):
+        return PendingVerification(
+            row["token"], row["email"], row["password_hash"], row["code_hash"], row["sent_at"], row["attempts"]
+        )
+
+    def _fetch(self, conn, token):
+        row = conn.execute(
+            "SELECT * FROM pending_verifications WHERE token = ? AND sent_at >= ?",
+            (token, time.time() - PENDING_TTL_SECONDS),
+        ).fetchone()
+        return self._entry(row) if row else None
+
+    def get(self, token):
+        return self._fetch(self._conn(), token)
+
+    def check_code(self, token, code):
+        conn = self._conn()
+        # BEGIN IMMEDIATE takes the write lock up front, so two workers cannot
+        # both accept the same code or lose an attempt increment.
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            entry = self._fetch(conn, token)
+            if entry is None:
+                result = "missing"
+            else:
+                result = _verify(entry, code, time.time())
+                if result == "ok":
+                    conn.execute("DELETE FROM pending_verifications WHERE token = ?", (token,))
+                elif result == "invalid":
+                    entry.attempts += 1
+                    conn.execute("UPDATE pending_verifications SET attempts = ? WHERE token = ?", (entry.attempts, token))
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        return result, entry
+
+    def reissue(self, token, code) -> bool:
+        conn = self._conn()
+        cursor = conn.execute(
+            "UPDATE pending_verifications SET code_hash = ?, sent_at = ?, attempts = 0 WHERE token = ? AND sent_at >= ?",
+            (_code_hash(token, code), time.time(), token, time.time() - PENDING_TTL_SECONDS),
+        )
+        return cursor.rowcount > 0
+
+    def delete(self, token):
+        self._conn().execute("DELETE FROM pending_verifications WHERE token = ?", (token,))
+
+    def _put(self, entry):
+        conn = self._conn()
+        self._evict(conn)
+        conn.execute(
+            "INSERT INTO pending_verifications (token, email, password_hash, code_hash, sent_at, attempts) VALUES (?, ?, ?, ?, ?, ?)",
+            (entry.token, entry.email, entry.password_hash, entry.code_hash, entry.sent_at, entry.attempts),
+        )
+
+
+@st.cache_resource
+def get_verification_store() -> VerificationStore:
+    """Store named by VERIFICATION_STORE ("memory" or "sqlite")."""
+    kind = str(get_setting("VERIFICATION_STORE", "memory")).lower()
+    if kind == "sqlite":
+        return SQLiteVerificationStore(get_setting("VERIFICATION_DB_PATH", "verification.db"))
+    if kind == "memory":
+        return MemoryVerificationStore()
+    raise ValueError(f"Unknown VERIFICATION_STORE: {kind}")